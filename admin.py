@@ -0,0 +1,29 @@
+import os
+import hmac
+from functools import wraps
+
+from flask import request
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+print(f"Admin token: {'set' if ADMIN_TOKEN else 'not set, admin endpoints disabled'} ($ADMIN_TOKEN)")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+
+def check_token(token):
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def is_admin_request():
+    return check_token(request.headers.get(ADMIN_TOKEN_HEADER, ""))
+
+
+def admin_required(view):
+    """
+    Обработчик доступен только с заголовком X-Admin-Token, равным $ADMIN_TOKEN
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return {"message": "Forbidden"}, 403
+        return view(*args, **kwargs)
+    return wrapper
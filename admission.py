@@ -0,0 +1,124 @@
+import os
+import math
+import time
+import threading
+
+from flask import request, g
+
+import metrics
+
+ADMISSION_LIMIT = int(os.environ.get("ADMISSION_LIMIT", 32))
+print(f"Admission limit: {ADMISSION_LIMIT} ($ADMISSION_LIMIT, 0 - disabled)")
+ADMISSION_MIN_LIMIT = int(os.environ.get("ADMISSION_MIN_LIMIT", 4))
+ADMISSION_MAX_LIMIT = int(os.environ.get("ADMISSION_MAX_LIMIT", 128))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", 16))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 0.5))
+ADMISSION_TARGET_LATENCY = float(os.environ.get("ADMISSION_TARGET_LATENCY", 1.0))
+
+
+class AdmissionController:
+    """
+    Ограничение числа одновременно обрабатываемых запросов с короткой очередью.
+
+    Лимит подстраивается по задержке (AIMD): если запрос обработан быстрее
+    target_latency, лимит растет на 1/limit, иначе уменьшается в 0.9 раза, но не чаще
+    раза в target_latency секунд: медленные запросы, начатые до уменьшения, его не повторяют
+    """
+
+    def __init__(self, name, limit=ADMISSION_LIMIT, min_limit=ADMISSION_MIN_LIMIT,
+                 max_limit=ADMISSION_MAX_LIMIT, queue_size=ADMISSION_QUEUE_SIZE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, target_latency=ADMISSION_TARGET_LATENCY):
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = min(min_limit, limit)
+        self.max_limit = max(max_limit, limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.waiting = 0
+        self.last_decrease = float("-inf")
+        self.condition = threading.Condition()
+
+        metrics.gauge(f"{name}.admission.in_flight", lambda: self.in_flight)
+        metrics.gauge(f"{name}.admission.queue_depth", lambda: self.waiting)
+        metrics.gauge(f"{name}.admission.limit", lambda: int(self.limit))
+
+    def acquire(self):
+        """
+        Занять место под запрос. False - мест нет и очередь полна или ожидание истекло
+        """
+        with self.condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                metrics.inc(f"{self.name}.admission.admitted")
+                return True
+            if self.waiting >= self.queue_size:
+                metrics.inc(f"{self.name}.admission.rejected")
+                return False
+
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.inc(f"{self.name}.admission.rejected")
+                        return False
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            metrics.inc(f"{self.name}.admission.admitted")
+            metrics.inc(f"{self.name}.admission.queued")
+            return True
+
+    def release(self, latency):
+        with self.condition:
+            self.in_flight -= 1
+            if latency > self.target_latency:
+                now = time.monotonic()
+                if now - self.last_decrease >= self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify()
+
+
+def exempt(view):
+    """
+    Не ограничивать обработчик (например, long-poll, который долго ждет, не нагружая сервис,
+    или потоковую выгрузку: ее время зависит от объема данных и не должно уменьшать лимит)
+    """
+    view.admission_exempt = True
+    return view
+
+
+def init_app(app, name, **kwargs):
+    """
+    Включить контроль нагрузки для приложения: при перегрузке запросы
+    (кроме /manage/* и обработчиков с @exempt) сразу получают 503 с Retry-After
+    """
+    if kwargs.get("limit", ADMISSION_LIMIT) <= 0:
+        return None
+    controller = AdmissionController(name, **kwargs)
+    retry_after = str(max(1, math.ceil(controller.queue_timeout)))
+
+    @app.before_request
+    def admit_request():
+        view = app.view_functions.get(request.endpoint)
+        if request.path.startswith("/manage/") or getattr(view, "admission_exempt", False):
+            return None
+        if not controller.acquire():
+            return {"message": "Service overloaded"}, 503, {"Retry-After": retry_after}
+        g.admitted_at = time.monotonic()
+        return None
+
+    @app.teardown_request
+    def release_request(exc):
+        admitted_at = g.pop("admitted_at", None)
+        if admitted_at is not None:
+            controller.release(time.monotonic() - admitted_at)
+
+    return controller
@@ -0,0 +1,193 @@
+import os
+import gzip
+import json
+import time
+import argparse
+from types import SimpleNamespace
+from datetime import date, datetime, timedelta
+
+import sqlalchemy as sa
+
+import database
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+print(f"Archive dir: {ARCHIVE_DIR} ($ARCHIVE_DIR)")
+
+
+def _dump_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value):
+    if value is not None and isinstance(column.type, (sa.DateTime, sa.Date)):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _write_ndjson(session, table, archive, rows, shard=None):
+    """
+    Записать rows в новый файл и добавить его в archive_file по индексируемым колонкам archive
+    """
+    table_dir = os.path.join(ARCHIVE_DIR, table.name)
+    os.makedirs(table_dir, exist_ok=True)
+    file_name = f"{datetime.now():%Y%m%d%H%M%S}-{shard or 0}-{rows[0]['id']}-{rows[-1]['id']}.ndjson.gz"
+    with gzip.open(os.path.join(table_dir, file_name), "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({key: _dump_value(value) for key, value in row.items()}) + "\n")
+    entries = index_entries(table, archive, rows, file_name)
+    if entries:
+        session.execute(database.archive_files.insert(), entries)
+
+
+def index_entries(table, archive, rows, file_name):
+    """
+    Строки archive_file для файла file_name со строками rows
+    """
+    return [
+        {"table_name": table.name, "column_name": column.name, "value": str(value), "path": file_name}
+        for column in archive.columns if column.index
+        for value in {row[column.name] for row in rows if row.get(column.name) is not None}
+    ]
+
+
+def read_ndjson(table):
+    """
+    (имя файла, строки) для всех NDJSON-файлов table
+    """
+    table_dir = os.path.join(ARCHIVE_DIR, table.name)
+    if not os.path.isdir(table_dir):
+        return
+    for name in sorted(os.listdir(table_dir)):
+        if name.endswith(".ndjson.gz"):
+            with gzip.open(os.path.join(table_dir, name), "rt", encoding="utf-8") as f:
+                yield name, [json.loads(line) for line in f]
+
+
+def reindex_ndjson(table, archive, shards=(None,), shard_of=lambda row: None):
+    """
+    Заново построить archive_file по всем NDJSON-файлам table (например, для файлов,
+    выгруженных до появления индекса). shard_of(row) - шард, в индекс которого попадает строка.
+    Возвращает число файлов
+    """
+    files = database.archive_files
+    entries = {shard: [] for shard in shards}
+    count = 0
+    for name, rows in read_ndjson(table):
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(shard_of(row), []).append(row)
+        for shard, shard_rows in by_shard.items():
+            entries[shard].extend(index_entries(table, archive, shard_rows, name))
+        count += 1
+
+    for shard, shard_entries in entries.items():
+        with database.Session(shard) as s:
+            s.execute(files.delete().where(files.c.table_name == table.name))
+            if shard_entries:
+                s.execute(files.insert(), shard_entries)
+    print(f"Reindexed {count} NDJSON files of {table.name}")
+    return count
+
+
+def archive_rows(table, archive, condition, batch_size=1000, target="table", shard=None):
+    """
+    Перенести строки table, подходящие под condition, в архив пачками по batch_size.
+
+    target="table" - в таблицу archive, target="ndjson" - в сжатые файлы в $ARCHIVE_DIR.
+    Каждая пачка переносится в отдельной транзакции, возвращается число перенесенных строк.
+    """
+    moved = 0
+    started = time.monotonic()
+    while True:
+        with database.Session(shard) as s:
+            rows = [dict(row) for row in s.execute(
+                sa.select(table.columns).where(condition).order_by(table.c.id).limit(batch_size)
+            )]
+            if not rows:
+                break
+            if target == "ndjson":
+                _write_ndjson(s, table, archive, rows, shard)
+            else:
+                s.execute(archive.insert(), rows)
+            s.execute(table.delete().where(table.c.id.in_([row["id"] for row in rows])))
+        moved += len(rows)
+    print(f"Archived {moved} rows from {table.name} to {target} in {time.monotonic() - started:.2f} s")
+    return moved
+
+
+def find_archived(table, archive, shard=None, **filters):
+    """
+    Поиск по архиву: таблица archive и NDJSON-файлы, в которых по archive_file есть искомое значение.
+    В filters должна быть хотя бы одна индексируемая колонка archive (см. database.archive_table),
+    иначе пришлось бы просматривать весь архив. Медленный путь: используется, только если
+    в основной таблице ничего не нашлось
+    """
+    indexed = [name for name in filters if archive.c[name].index]
+    if not indexed:
+        raise ValueError(f"{archive.name}: search by {', '.join(filters)} is not indexed")
+    files = database.archive_files
+    with database.Session(shard, readonly=True) as s:
+        query = sa.select(archive.columns)
+        for name, value in filters.items():
+            query = query.where(archive.c[name] == value)
+        found = [SimpleNamespace(**dict(row)) for row in s.execute(query.order_by(archive.c.id))]
+        paths = [path for path, in s.execute(
+            sa.select([files.c.path]).distinct()
+            .where(files.c.table_name == table.name)
+            .where(files.c.column_name == indexed[0])
+            .where(files.c.value == str(filters[indexed[0]]))
+            .order_by(files.c.path)
+        )]
+
+    for path in paths:
+        with gzip.open(os.path.join(ARCHIVE_DIR, table.name, path), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if all(row.get(name) == value for name, value in filters.items()):
+                    found.append(SimpleNamespace(**{
+                        name: _load_value(table.c[name], value) for name, value in row.items()
+                    }))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос старых записей в архив")
+    parser.add_argument("service", choices=["order", "warehouse", "warranty"])
+    parser.add_argument("--older-than-days", type=int, default=365)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--target", choices=["table", "ndjson"], default="table")
+    parser.add_argument("--reindex", action="store_true",
+                        help="ничего не переносить, только заново построить индекс NDJSON-файлов")
+    args = parser.parse_args()
+
+    cutoff = datetime.combine(date.today() - timedelta(days=args.older_than_days), datetime.min.time())
+    kwargs = {"batch_size": args.batch_size, "target": args.target}
+    if args.service == "order":
+        import order_service
+        database.create_schema()
+        if args.reindex:
+            reindex_ndjson(order_service.Order.__table__, order_service.OrderArchive,
+                           shards=range(len(database.shard_engines)),
+                           shard_of=lambda row: database.shard_for(row["user_uid"]))
+        else:
+            order_service.archive_orders(cutoff, **kwargs)
+    elif args.service == "warehouse":
+        import warehouse_service
+        database.create_schema()
+        if args.reindex:
+            reindex_ndjson(warehouse_service.OrderItem.__table__, warehouse_service.OrderItemArchive)
+        else:
+            warehouse_service.archive_order_items(**kwargs)
+    else:
+        import warranty_service
+        database.create_schema()
+        if args.reindex:
+            reindex_ndjson(warranty_service.Warranty.__table__, warranty_service.WarrantyArchive)
+        else:
+            warranty_service.archive_warranties(cutoff, **kwargs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кеш ограниченного размера; записи живут не дольше ttl секунд
+    """
+
+    def __init__(self, name, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        metrics.gauge(f"{name}.cache.hits", lambda: self.hits)
+        metrics.gauge(f"{name}.cache.misses", lambda: self.misses)
+        metrics.gauge(f"{name}.cache.size", lambda: len(self.items))
+
+    def get(self, key):
+        """
+        Значение или None, если его нет или оно устарело
+        """
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self.items[key]
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class StaleWhileRevalidate:
+    """
+    Последние удачные значения по ключу, чтобы читать при медленных или недоступных зависимостях.
+    Значение моложе fresh секунд отдается как есть; моложе fresh + stale - отдается сразу
+    с пометкой stale, а новое запрашивается в фоне; более старое запрашивается синхронно.
+
+    Фоновые обновления выполняются пулом из workers потоков; если в очереди уже
+    max_pending ключей, новое обновление не ставится - stale значение отдается как есть
+    """
+
+    def __init__(self, name, maxsize, fresh, stale, workers=4, max_pending=32):
+        self.name = name
+        self.maxsize = maxsize
+        self.fresh = fresh
+        self.stale = stale
+        self.max_pending = max_pending
+        self.items = OrderedDict()
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-refresh")
+
+        metrics.gauge(f"{name}.swr.size", lambda: len(self.items))
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.stale > 0
+
+    def get(self, key, fetch, revalidate=None):
+        """
+        (value, stale). fetch() возвращает свежее значение или бросает исключение,
+        которое доходит до вызывающего, только если подходящего сохраненного значения нет.
+        revalidate() - чем обновлять значение в фоне (по умолчанию fetch); сохраненное значение
+        в пределах окна отдается сразу, без синхронных запросов к зависимости
+        """
+        if not self.enabled:
+            return fetch(), False
+        with self.lock:
+            item = self.items.get(key)
+        if item is not None:
+            age = time.monotonic() - item[0]
+            if age < self.fresh:
+                return item[1], False
+            if age < self.fresh + self.stale:
+                metrics.inc(f"{self.name}.swr.stale")
+                self.refresh(key, revalidate or fetch)
+                return item[1], True
+        return self.load(key, fetch), False
+
+    def load(self, key, fetch):
+        value = fetch()
+        with self.lock:
+            self.items[key] = (time.monotonic(), value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        return value
+
+    def refresh(self, key, fetch):
+        """
+        Обновить значение в фоне; для одного ключа одновременно идет не больше одного обновления
+        """
+        with self.lock:
+            if key in self.refreshing:
+                return None
+            if len(self.refreshing) >= self.max_pending:
+                metrics.inc(f"{self.name}.swr.refresh_skipped")
+                return None
+            self.refreshing.add(key)
+
+        def run():
+            try:
+                self.load(key, fetch)
+            except Exception as e:
+                metrics.inc(f"{self.name}.swr.refresh_failed")
+                print(f"{self.name}: refresh of {key} failed:", repr(e))
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        return self.executor.submit(run)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
@@ -0,0 +1,171 @@
+import time
+import heapq
+import threading
+from datetime import datetime
+
+import sqlalchemy as sa
+from flask import request
+
+import database
+import admission
+import service_client
+import wire
+
+CHANGES_POLL_INTERVAL = 1.0
+CHANGES_MAX_LIMIT = 1000
+CHANGES_MAX_TIMEOUT = 60
+
+
+class ChangeFeed:
+    """
+    Журнал изменений сущностей сервиса: append-only таблица с возрастающим seq.
+
+    record() пишет изменение в той же транзакции, что и само изменение.
+    seq выдается через UPDATE счетчика <table_name>_seq: блокировка строки счетчика
+    держится до commit, поэтому транзакции коммитятся в порядке seq и читатель,
+    увидевший seq N, уже не пропустит меньший seq. Запись в журнал лучше делать
+    в конце транзакции, чтобы не держать блокировку счетчика долго.
+
+    sharded=True - журнал ведется на каждом шарде database.shard_engines рядом с данными
+    (record() вызывается в сессии нужного шарда), seq у каждого шарда свой.
+
+    После commit ждущие long-poll запросы этого процесса просыпаются сразу,
+    запросы в других процессах увидят изменение не позже CHANGES_POLL_INTERVAL
+    """
+
+    def __init__(self, table_name, sharded=False):
+        self.sharded = sharded
+        self.table = sa.Table(
+            table_name, database.Base.metadata,
+            sa.Column("seq", sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column("entity_uid", sa.Text),
+            sa.Column("kind", sa.VARCHAR(64)),
+            sa.Column("status", sa.VARCHAR(255), nullable=True),
+            sa.Column("created_at", sa.TIMESTAMP),
+        )
+        self.counter = sa.Table(
+            f"{table_name}_seq", database.Base.metadata,
+            sa.Column("seq", sa.Integer, nullable=False),
+        )
+        self.counter.add_is_dependent_on(self.table)
+        sa.event.listen(self.counter, "after_create", self.init_counter)
+        self.condition = threading.Condition()
+
+    def init_counter(self, target, connection, **kwargs):
+        # журнал мог существовать до счетчика - продолжаем с его последнего seq
+        connection.execute(self.counter.insert().from_select(
+            ["seq"], sa.select([sa.func.coalesce(sa.func.max(self.table.c.seq), 0)])
+        ))
+
+    def shards(self):
+        return list(range(len(database.shard_engines))) if self.sharded else [None]
+
+    def notify(self, *args):
+        with self.condition:
+            self.condition.notify_all()
+
+    def record(self, session, entity_uid, kind, status=None):
+        self.record_many(session, [(entity_uid, kind, status)])
+
+    def record_many(self, session, changes):
+        """
+        Записать несколько изменений (entity_uid, kind, status) одним INSERT
+        """
+        if not changes:
+            return
+        session.execute(self.counter.update().values(seq=self.counter.c.seq + len(changes)))
+        first_seq = session.execute(sa.select([self.counter.c.seq])).scalar() - len(changes) + 1
+        now = datetime.now()
+        session.execute(self.table.insert().values([
+            {"seq": first_seq + i, "entity_uid": entity_uid, "kind": kind, "status": status, "created_at": now}
+            for i, (entity_uid, kind, status) in enumerate(changes)
+        ]))
+        sa.event.listen(session, "after_commit", self.notify, once=True)
+
+    def record_from_select(self, session, kind, select):
+        """
+        Записать изменения для всех строк select (entity_uid, status)
+        """
+        self.record_many(session, [(entity_uid, kind, status) for entity_uid, status in session.execute(select)])
+
+    def parse_cursor(self, text):
+        """
+        Курсор - seq по каждому шарду через запятую; одно число подходит для всех шардов (since=0)
+        """
+        cursor = [int(seq) for seq in str(text).split(",")]
+        shard_count = len(self.shards())
+        if len(cursor) == 1:
+            return cursor * shard_count
+        if len(cursor) != shard_count:
+            raise ValueError(f"Cursor must have 1 or {shard_count} values")
+        return cursor
+
+    @staticmethod
+    def format_cursor(cursor):
+        return cursor[0] if len(cursor) == 1 else ",".join(map(str, cursor))
+
+    def read(self, cursor, limit):
+        """
+        Изменения после cursor (список seq по шардам) и новый курсор.
+        Журналы шардов сливаются по created_at
+        """
+        per_shard = []
+        for number, shard in enumerate(self.shards()):
+            with database.Session(shard, readonly=True) as s:
+                per_shard.append([dict(row, shard=number) for row in s.execute(
+                    sa.select(self.table.columns)
+                    .where(self.table.c.seq > cursor[number])
+                    .order_by(self.table.c.seq)
+                    .limit(limit)
+                )])
+        changes = list(heapq.merge(*per_shard, key=lambda change: change["created_at"]))[:limit]
+        cursor = list(cursor)
+        for change in changes:
+            cursor[change["shard"]] = change["seq"]
+        return changes, cursor
+
+    def wait(self, cursor, limit, timeout):
+        """
+        Изменения после cursor; если их нет - ждать до timeout секунд
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            changes, next_cursor = self.read(cursor, limit)
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                return changes, next_cursor
+            with self.condition:
+                self.condition.wait(min(remaining, CHANGES_POLL_INTERVAL))
+
+    def init_app(self, app, path):
+        """
+        GET path?since=N&limit=100&timeout=25 - long-poll за изменениями после курсора N.
+        lastSeq из ответа - курсор для следующего запроса: число, а для нескольких шардов
+        строка с seq каждого шарда через запятую
+        """
+        @admission.exempt
+        def request_changes():
+            try:
+                cursor = self.parse_cursor(request.args.get("since", 0))
+                limit = min(int(request.args.get("limit", 100)), CHANGES_MAX_LIMIT)
+                timeout = min(float(request.args.get("timeout", 25)), CHANGES_MAX_TIMEOUT)
+            except ValueError as e:
+                return {"message": str(e)}, 400
+            budget = service_client.remaining()
+            if budget is not None:
+                timeout = min(timeout, budget)
+
+            changes, next_cursor = self.wait(cursor, limit, timeout)
+            return wire.jsonify({
+                "changes": [{
+                    "seq": change["seq"],
+                    **({"shard": change["shard"]} if len(cursor) > 1 else {}),
+                    "uid": change["entity_uid"],
+                    "kind": change["kind"],
+                    "status": change["status"],
+                    "createdAt": change["created_at"].isoformat(),
+                } for change in changes],
+                "lastSeq": self.format_cursor(next_cursor),
+            }), 200
+
+        app.add_url_rule(path, "request_changes", request_changes, methods=["GET"])
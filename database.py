@@ -1,39 +1,211 @@
 import os
+import zlib
+import time
+import threading
+from collections import OrderedDict
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, Table, Column, Index, Integer, Text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import Session as ORMSession
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext import baked
 
 Base = declarative_base()
+# кеш скомпилированных запросов для горячих путей, см. sqlalchemy.ext.baked
+bakery = baked.bakery()
 DATABASE_URL = os.environ.get('DATABASE_URL', "sqlite:///temp.db")
 print("DATABASE_URL:", DATABASE_URL, "($DATABASE_URL)")
 engine = create_engine(DATABASE_URL)
+SHARD_URLS = [url.strip() for url in os.environ.get('SHARD_URLS', '').split(',') if url.strip()]
+print("SHARD_URLS:", SHARD_URLS, "($SHARD_URLS)")
+shard_engines = [create_engine(url) for url in SHARD_URLS] or [engine]
+REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+print("DATABASE_REPLICA_URLS:", REPLICA_URLS, "($DATABASE_REPLICA_URLS)")
+replica_engines = [create_engine(url) for url in REPLICA_URLS]
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+print("READ_YOUR_WRITES_SECONDS:", READ_YOUR_WRITES_SECONDS, "($READ_YOUR_WRITES_SECONDS)")
+REPLICA_RETRY_SECONDS = 30
+
+
+class _ReplicaState:
+    lock = threading.Lock()
+    next_replica = 0
+    # клиент -> время последней записи, самые старые в начале
+    last_writes = OrderedDict()
+    down_until = {}
+
+
+_client = threading.local()
+
+
+def set_client(key):
+    """
+    Клиент, от имени которого работает текущий поток (user_uid или X-Client-Id), None - неизвестен.
+    Read-your-writes соблюдается для каждого клиента отдельно
+    """
+    _client.key = key
+
+
+def current_client():
+    return getattr(_client, "key", None)
+
+
+def mark_write(client):
+    if client is None:
+        return
+    now = time.monotonic()
+    with _ReplicaState.lock:
+        _ReplicaState.last_writes[client] = now
+        _ReplicaState.last_writes.move_to_end(client)
+        while _ReplicaState.last_writes:
+            oldest = next(iter(_ReplicaState.last_writes))
+            if now - _ReplicaState.last_writes[oldest] < READ_YOUR_WRITES_SECONDS:
+                break
+            del _ReplicaState.last_writes[oldest]
+
+
+def wrote_recently(client):
+    if client is None:
+        return False
+    return time.monotonic() - _ReplicaState.last_writes.get(client, float("-inf")) < READ_YOUR_WRITES_SECONDS
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _track_writes(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        _client.wrote = True
+
+
+def replica_connection():
+    """
+    Соединение с репликой для чтения: реплики перебираются по кругу, недоступная реплика
+    пропускается REPLICA_RETRY_SECONDS секунд. None - читать нужно с основной базы:
+    реплик нет, все недоступны, или текущий клиент недавно что-то записал
+    """
+    now = time.monotonic()
+    if not replica_engines or wrote_recently(current_client()):
+        return None
+
+    with _ReplicaState.lock:
+        start = _ReplicaState.next_replica
+        _ReplicaState.next_replica = (start + 1) % len(replica_engines)
+
+    for i in range(len(replica_engines)):
+        replica = replica_engines[(start + i) % len(replica_engines)]
+        if _ReplicaState.down_until.get(replica, 0) > now:
+            continue
+        try:
+            return replica.connect()
+        except Exception as e:
+            print("Replica unavailable:", replica.url, repr(e))
+            _ReplicaState.down_until[replica] = now + REPLICA_RETRY_SECONDS
+    return None
+
+
+def shard_for(key, shard_count=None):
+    """
+    Номер шарда для ключа (user_uid). Хеш стабилен между процессами и перезапусками
+    """
+    return zlib.crc32(key.encode()) % (shard_count or len(shard_engines))
 
 
 def create_schema(engine_=engine):
     Base.metadata.create_all(engine_, checkfirst=True)
+    if engine_ is engine:
+        for shard_engine in shard_engines:
+            if shard_engine is not engine:
+                Base.metadata.create_all(shard_engine, checkfirst=True)
 
 
 def drop_schema(engine_=engine):
     Base.metadata.drop_all(engine_, checkfirst=True)
 
 
+def archive_table(table, *indexed):
+    """
+    Таблица <name>_archive с теми же колонками, что и table, но без ограничений уникальности.
+    indexed - колонки, по которым ищут в архиве: по ним строятся индексы, а при выгрузке
+    в NDJSON их значения попадают в archive_file
+    """
+    return Table(
+        f"{table.name}_archive", Base.metadata,
+        *[Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False,
+                 index=column.name in indexed)
+          for column in table.columns]
+    )
+
+
+# индекс NDJSON-архива: значение индексируемой колонки -> файл, в котором есть такие строки
+archive_files = Table(
+    "archive_file", Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("table_name", Text),
+    Column("column_name", Text),
+    Column("value", Text),
+    Column("path", Text),
+    Index("ix_archive_file_lookup", "table_name", "column_name", "value"),
+)
+
+
+_hold_time = threading.local()
+
+
+def reset_hold_time():
+    _hold_time.seconds = 0.0
+
+
+def hold_time():
+    """
+    Сколько секунд текущий поток держал сессии (и соединения) с момента reset_hold_time
+    """
+    return getattr(_hold_time, "seconds", 0.0)
+
+
 class Session:
+    """
+    Сессия с commit при выходе без исключения.
+    Session(shard) - сессия к шарду с номером shard (см. shard_for), Session() - к DATABASE_URL.
+    Session(readonly=True) - только для чтения: идет на реплику, если она есть, и не коммитится.
+    Реплики $DATABASE_REPLICA_URLS - реплики DATABASE_URL, поэтому шард идет на них,
+    только если это и есть DATABASE_URL (без $SHARD_URLS). from_replica - сессия читает с реплики
+    """
     session = None
     session_class = None
+    connection = None
+    readonly = False
+    from_replica = False
+    entered_at = 0.0
+    wrote_before = False
 
-    def __init__(self) -> None:
-        self.session_class = sessionmaker(bind=engine)
+    def __init__(self, shard=None, readonly=False) -> None:
+        self.readonly = readonly
+        if readonly and (shard is None or shard_engines[shard] is engine):
+            self.connection = replica_connection()
+        self.from_replica = self.connection is not None
+        if self.connection is not None:
+            self.session_class = sessionmaker(bind=self.connection)
+        else:
+            self.session_class = sessionmaker(bind=engine if shard is None else shard_engines[shard])
 
     def __enter__(self) -> ORMSession:
+        self.entered_at = time.monotonic()
+        self.wrote_before = getattr(_client, "wrote", False)
+        _client.wrote = False
         self.session = self.session_class()
         return self.session
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
-        if not exc_type:
+        if not exc_type and not self.readonly:
             self.session.commit()
+            if _client.wrote:
+                mark_write(current_client())
         else:
             self.session.rollback()
+        _client.wrote = self.wrote_before or _client.wrote
         self.session.close()
         self.session = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        _hold_time.seconds = hold_time() + time.monotonic() - self.entered_at
@@ -0,0 +1,214 @@
+import io
+import csv
+import time
+import random
+import argparse
+from uuid import UUID
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+import database
+from store_service import User
+from order_service import Order
+from warehouse_service import Item, OrderItem
+from warranty_service import Warranty, Status, WARRANTY_PERIOD_DAYS
+
+SIZES = ["S", "M", "L", "XL"]
+
+
+def bulk_insert(engine, table, rows):
+    """
+    Быстрая вставка: COPY для Postgres, executemany в одной транзакции для остальных
+    """
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    if engine.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([r"\N" if row[c] is None else row[c] for c in columns])
+        buffer.seek(0)
+        connection = engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buffer
+                )
+            connection.commit()
+        finally:
+            connection.close()
+    else:
+        with engine.begin() as connection:
+            connection.execute(table.insert(), rows)
+
+
+def prepare_engine(engine):
+    database.Base.metadata.create_all(engine, checkfirst=True)
+    if engine.dialect.name == "sqlite":
+        @sa.event.listens_for(engine, "connect")
+        def fast_sqlite(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA synchronous=OFF")
+            dbapi_connection.execute("PRAGMA journal_mode=MEMORY")
+        engine.dispose()
+
+
+def next_id(engine, table):
+    return (engine.execute(sa.select([sa.func.max(table.c.id)])).scalar() or 0) + 1
+
+
+def advance_sequence(engine, table):
+    """
+    Сдвинуть serial-последовательность id после вставки строк с явными id (Postgres),
+    иначе следующая вставка без id (refresh_items_in_db при запуске сервиса) получит занятый id
+    """
+    if engine.dialect.name == "postgresql":
+        engine.execute(sa.text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT coalesce(max(id), 1) FROM {table.name}))"
+        ))
+
+
+class Skewed:
+    """
+    Выбор из count элементов: hot_share первых элементов получают hot_traffic всех выборок
+    """
+
+    def __init__(self, rng, count, hot_share, hot_traffic):
+        self.rng = rng
+        self.count = count
+        self.hot_count = max(1, int(count * hot_share))
+        self.hot_traffic = hot_traffic
+
+    def pick(self):
+        if self.hot_count >= self.count or self.rng.random() < self.hot_traffic:
+            return self.rng.randrange(self.hot_count)
+        return self.rng.randrange(self.hot_count, self.count)
+
+
+def generate(orders, users, items, store_engine, order_engines, warehouse_engine, warranty_engine,
+             hot_share=0.2, hot_traffic=0.8, canceled_share=0.05, days=730,
+             batch_size=10000, seed=0):
+    """
+    Сгенерировать users, item, orders, order_item, warranty со связями между ними.
+    order_engines - список шардов, заказ пишется в database.shard_for(user_uid),
+    номер шарда записывается в начало order_uid, поэтому order_location не нужен.
+    Сервисы при запуске только добавляют недостающие стандартные users и item
+    (refresh_items_in_db), поэтому сгенерированные данные сохраняются
+    """
+    rng = random.Random(seed)
+
+    def uid():
+        return str(UUID(int=rng.getrandbits(128), version=4))
+
+    started = time.monotonic()
+    first_user_id = next_id(store_engine, User.__table__)
+    user_uids = [uid() for _ in range(users)]
+    for offset in range(0, users, batch_size):
+        bulk_insert(store_engine, User.__table__, [
+            {"id": first_user_id + i, "name": f"user-{first_user_id + i}", "user_uid": user_uids[i]}
+            for i in range(offset, min(offset + batch_size, users))
+        ])
+    advance_sequence(store_engine, User.__table__)
+
+    first_item_id = next_id(warehouse_engine, Item.__table__)
+    item_ids = list(range(first_item_id, first_item_id + items))
+    bulk_insert(warehouse_engine, Item.__table__, [
+        {"id": item_id, "available_count": rng.randint(0, 10000),
+         "model": f"Lego {item_id}", "size": rng.choice(SIZES)}
+        for item_id in item_ids
+    ])
+    advance_sequence(warehouse_engine, Item.__table__)
+
+    user_picker = Skewed(rng, users, hot_share, hot_traffic)
+    item_picker = Skewed(rng, items, hot_share, hot_traffic)
+    now = datetime.now().replace(microsecond=0)
+    warranty_cutoff = now - timedelta(days=WARRANTY_PERIOD_DAYS)
+
+    for offset in range(0, orders, batch_size):
+        order_rows = [[] for _ in order_engines]
+        order_item_rows, warranty_rows = [], []
+        for _ in range(offset, min(offset + batch_size, orders)):
+            user_uid = user_uids[user_picker.pick()]
+            shard = database.shard_for(user_uid, len(order_engines))
+            order_uid, order_item_uid = f"{shard:04x}{uid()[4:]}", uid()
+            order_date = now - timedelta(seconds=rng.randrange(days * 86400))
+            canceled = rng.random() < canceled_share
+
+            order_item_rows.append({
+                "canceled": canceled, "order_item_uid": order_item_uid,
+                "order_uid": order_uid, "item_id": item_ids[item_picker.pick()],
+            })
+            if canceled:
+                status = Status.removed
+            elif order_date < warranty_cutoff:
+                status = Status.expired
+            else:
+                status = Status.on
+            warranty_rows.append({
+                "comment": None, "item_uid": order_item_uid,
+                "status": status.value, "warranty_date": order_date,
+            })
+            if not canceled:
+                order_rows[shard].append({
+                    "item_uid": order_item_uid, "order_date": order_date,
+                    "order_uid": order_uid, "status": "PAID", "user_uid": user_uid,
+                })
+
+        for engine, rows in zip(order_engines, order_rows):
+            bulk_insert(engine, Order.__table__, rows)
+        bulk_insert(warehouse_engine, OrderItem.__table__, order_item_rows)
+        bulk_insert(warranty_engine, Warranty.__table__, warranty_rows)
+
+        done = min(offset + batch_size, orders)
+        elapsed = time.monotonic() - started
+        print(f"Generated {done}/{orders} orders ({done / elapsed:.0f} orders/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация больших объемов тестовых данных")
+    parser.add_argument("--orders", type=int, default=10 ** 4)
+    parser.add_argument("--users", type=int, default=None, help="по умолчанию orders / 10")
+    parser.add_argument("--items", type=int, default=1000, help="число моделей (SKU)")
+    parser.add_argument("--hot-share", type=float, default=0.2, help="доля горячих пользователей и SKU")
+    parser.add_argument("--hot-traffic", type=float, default=0.8, help="доля заказов на горячие")
+    parser.add_argument("--canceled-share", type=float, default=0.05)
+    parser.add_argument("--days", type=int, default=730, help="за сколько дней распределить заказы")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store-url", default=database.DATABASE_URL)
+    parser.add_argument("--order-urls", default=",".join(database.SHARD_URLS or [database.DATABASE_URL]),
+                        help="шарды order_service через запятую")
+    parser.add_argument("--warehouse-url", default=database.DATABASE_URL)
+    parser.add_argument("--warranty-url", default=database.DATABASE_URL)
+    args = parser.parse_args()
+
+    engines = {}
+
+    def engine_for(url):
+        if url not in engines:
+            engines[url] = sa.create_engine(url)
+            prepare_engine(engines[url])
+        return engines[url]
+
+    generate(
+        orders=args.orders,
+        users=args.users or max(1, args.orders // 10),
+        items=args.items,
+        store_engine=engine_for(args.store_url),
+        order_engines=[engine_for(url) for url in args.order_urls.split(",")],
+        warehouse_engine=engine_for(args.warehouse_url),
+        warranty_engine=engine_for(args.warranty_url),
+        hot_share=args.hot_share,
+        hot_traffic=args.hot_traffic,
+        canceled_share=args.canceled_share,
+        days=args.days,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+
+
+if __name__ == '__main__':
+    main()
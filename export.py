@@ -0,0 +1,62 @@
+import os
+import json
+from datetime import date, datetime
+
+import sqlalchemy as sa
+from flask import request, Response, stream_with_context
+
+import database
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+
+def _parse_date(name):
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+
+def _dump_row(row):
+    return json.dumps({
+        key: value.isoformat() if isinstance(value, (date, datetime)) else value
+        for key, value in row.items()
+    }) + "\n"
+
+
+def _stream_table(table, date_column, date_from, date_to, shard):
+    with database.Session(shard, readonly=True) as s:
+        query = sa.select(table.columns).order_by(table.c.id)
+        if date_from:
+            query = query.where(table.c[date_column] >= date_from)
+        if date_to:
+            query = query.where(table.c[date_column] < date_to)
+        result = s.execute(query.execution_options(stream_results=True))
+        while True:
+            rows = result.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield "".join(_dump_row(row) for row in rows)
+
+
+def export_ndjson(table, date_column, archive=None, shards=(None,)):
+    """
+    Потоковая выгрузка всех строк table в NDJSON.
+
+    Параметры запроса: from, to - диапазон по date_column (ISO-дата, to не включается),
+    includeArchived=true - добавить строки архивной таблицы archive.
+    Строки читаются курсором на стороне сервера (stream_results) пачками по $EXPORT_BATCH_SIZE,
+    поэтому память не зависит от размера таблицы
+    """
+    try:
+        date_from, date_to = _parse_date("from"), _parse_date("to")
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    tables = [table]
+    if archive is not None and request.args.get("includeArchived") == "true":
+        tables.append(archive)
+
+    def generate():
+        for shard in shards:
+            for source in tables:
+                yield from _stream_table(source, date_column, date_from, date_to, shard)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
@@ -0,0 +1,70 @@
+import time
+import queue
+import threading
+
+import database
+import metrics
+
+
+class _Pending:
+    def __init__(self, item):
+        self.item = item
+        # пишет поток writer'а, поэтому запись отмечается для read-your-writes клиента вызывающего
+        self.client = database.current_client()
+        self.result = None
+        self.done = threading.Event()
+
+
+class GroupCommitWriter:
+    """
+    Собирает одновременные записи в пачки и пишет их одним вызовом flush.
+
+    flush(items) получает до max_batch элементов, накопленных за window секунд
+    после первого, и возвращает список результатов той же длины: None - успех,
+    исключение - ошибка именно этого элемента. submit() ждет свою пачку и
+    выбрасывает исключение своего элемента
+    """
+
+    def __init__(self, name, flush, window=0.005, max_batch=100):
+        self.name = name
+        self.flush = flush
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"{name}-group-commit", daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        pending = _Pending(item)
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.result is not None:
+            raise pending.result
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.flush([pending.item for pending in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            metrics.inc(f"{self.name}.group_commit.batches")
+            metrics.inc(f"{self.name}.group_commit.rows", len(batch))
+            for pending, result in zip(batch, results):
+                if result is None:
+                    database.mark_write(pending.client)
+                pending.result = result
+                pending.done.set()
@@ -0,0 +1,347 @@
+"""
+Нагрузочный прогон по коллекции Postman.
+
+Каждый шаг коллекции (postman_tests/postman-collection.json) становится шагом сценария.
+Виртуальный пользователь проходит шаги по порядку со своей копией переменных окружения,
+а переменные из prerequest/test-скриптов (uuid.v4(), pm.environment.set(...)) вычисляются
+так же, как в Postman. Число пользователей меняется по расписанию --stages,
+в конце печатаются перцентили задержек по каждому шагу
+"""
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter
+
+import requests
+
+VARIABLE = re.compile(r"\{\{(\w+)\}\}")
+UUID_VARIABLE = re.compile(r'setEnvironmentVariable\("(\w+)",\s*uuid\.v4\(\)\)')
+EXPECTED_STATUS = re.compile(r"pm\.response\.to\.have\.status\((\d+)\)")
+SET_FROM_RESPONSE = re.compile(r'pm\.environment\.set\("(\w+)",\s*response\.(\w+)\)')
+SET_FROM_LOCAL = re.compile(r'pm\.environment\.set\("(\w+)",\s*(\w+)\)')
+HEADER_LOCAL = re.compile(r'var (\w+) = pm\.response\.headers\.get\("([\w-]+)"\)')
+LAST_SEGMENT_LOCAL = re.compile(r'var (\w+) = (\w+)\.split\("/"\)\.pop\(\)')
+DURATION = re.compile(r"^(\d+(?:\.\d+)?)(ms|s|m)?$")
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Extractor:
+    """
+    Откуда взять переменную после ответа: поле JSON или заголовок (целиком или последний сегмент пути)
+    """
+
+    def __init__(self, variable, field=None, header=None, last_segment=False):
+        self.variable = variable
+        self.field = field
+        self.header = header
+        self.last_segment = last_segment
+
+    def extract(self, response):
+        if self.field is not None:
+            return response.json()[self.field]
+        value = response.headers[self.header]
+        return value.rsplit("/", 1)[-1] if self.last_segment else value
+
+
+class Step:
+    def __init__(self, name, method, url, headers=None, body=None, uuid_variables=(),
+                 expected_status=None, extractors=()):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.headers = headers or {}
+        self.body = body
+        self.uuid_variables = list(uuid_variables)
+        self.expected_status = expected_status
+        self.extractors = list(extractors)
+
+
+def _script(item, listen):
+    return "\n".join(
+        "\n".join(event["script"].get("exec", []))
+        for event in item.get("event", []) if event.get("listen") == listen
+    )
+
+
+def parse_extractors(script):
+    """
+    Разобрать присваивания pm.environment.set в test-скрипте.
+    Поддерживаются формы, которые есть в коллекции: поле ответа и заголовок (с .split("/").pop())
+    """
+    locals_ = {name: Extractor(None, header=header) for name, header in HEADER_LOCAL.findall(script)}
+    for name, source in LAST_SEGMENT_LOCAL.findall(script):
+        if source in locals_:
+            locals_[name] = Extractor(None, header=locals_[source].header, last_segment=True)
+
+    extractors = [Extractor(variable, field=field) for variable, field in SET_FROM_RESPONSE.findall(script)]
+    for variable, name in SET_FROM_LOCAL.findall(script):
+        if name in locals_:
+            extractors.append(Extractor(variable, header=locals_[name].header,
+                                        last_segment=locals_[name].last_segment))
+    return extractors
+
+
+def parse_step(item):
+    request = item["request"]
+    url = request["url"] if isinstance(request["url"], str) else request["url"]["raw"]
+    body = request.get("body") or {}
+    test_script = _script(item, "test")
+    status = EXPECTED_STATUS.search(test_script)
+    return Step(
+        name=item["name"],
+        method=request["method"],
+        url=url,
+        headers={h["key"]: h["value"] for h in request.get("header", []) if not h.get("disabled")},
+        body=body.get("raw") if body.get("mode") == "raw" else None,
+        uuid_variables=UUID_VARIABLE.findall(_script(item, "prerequest")),
+        expected_status=int(status.group(1)) if status else None,
+        extractors=parse_extractors(test_script),
+    )
+
+
+def load_collection(path, folders=None):
+    """
+    Шаги коллекции в порядке Postman runner. folders - имена папок верхнего уровня, None - все
+    """
+    with open(path) as f:
+        collection = json.load(f)
+
+    def walk(items):
+        for item in items:
+            if "item" in item:
+                yield from walk(item["item"])
+            else:
+                yield parse_step(item)
+
+    return [
+        step
+        for item in collection["item"] if not folders or item["name"] in folders
+        for step in walk([item])
+    ]
+
+
+def load_environment(path):
+    with open(path) as f:
+        environment = json.load(f)
+    return {v["key"]: v["value"] for v in environment["values"] if v.get("enabled", True)}
+
+
+def substitute(text, variables):
+    if text is None:
+        return None
+    return VARIABLE.sub(lambda m: str(variables.get(m.group(1), m.group(0))), text)
+
+
+def parse_duration(text):
+    match = DURATION.match(text.strip())
+    if not match:
+        raise ValueError(f"Bad duration: {text}")
+    value, unit = float(match.group(1)), match.group(2) or "s"
+    return value * {"ms": 0.001, "s": 1, "m": 60}[unit]
+
+
+def parse_stages(text):
+    """
+    "30s:10,1m:50,30s:0" - за 30 секунд дойти до 10 пользователей, за минуту до 50, за 30 секунд до 0
+    """
+    stages = []
+    for part in text.split(","):
+        duration, users = part.split(":")
+        stages.append((parse_duration(duration), int(users)))
+    return stages
+
+
+def target_users(stages, elapsed):
+    """
+    Сколько пользователей должно работать через elapsed секунд: линейно между целями стадий
+    """
+    start_users = 0
+    for duration, users in stages:
+        if elapsed < duration:
+            return round(start_users + (users - start_users) * elapsed / duration)
+        elapsed -= duration
+        start_users = users
+    return start_users
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(len(sorted_values) * p / 100 + 0.5) - 1))]
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = Counter()
+
+
+class LoadRun:
+    """
+    Прогон сценария steps. session_factory создает requests.Session для каждого виртуального
+    пользователя (в тестах к нему монтируется транспорт monolith.InProcessAdapter)
+    """
+
+    def __init__(self, steps, environment, stages, session_factory=requests.Session,
+                 timeout=10.0, think_time=0.0, tick=0.1, report_interval=None):
+        self.steps = steps
+        self.environment = environment
+        self.stages = stages
+        self.session_factory = session_factory
+        self.timeout = timeout
+        self.think_time = think_time
+        self.tick = tick
+        self.report_interval = report_interval
+        self.lock = threading.Lock()
+        self.stats = {step.name: StepStats() for step in steps}
+        self.iterations = 0
+        self.elapsed = 0.0
+        self.finished = threading.Event()
+
+    def execute(self, session, step, variables):
+        """
+        Выполнить шаг, обновить variables. False - шаг не прошел, итерацию дальше не продолжаем
+        """
+        for name in step.uuid_variables:
+            variables[name] = str(uuid.uuid4())
+        status, ok = None, False
+        started = time.monotonic()
+        try:
+            response = session.request(
+                step.method, substitute(step.url, variables),
+                headers={k: substitute(v, variables) for k, v in step.headers.items()},
+                data=substitute(step.body, variables),
+                timeout=self.timeout,
+            )
+            latency = time.monotonic() - started
+            status = response.status_code
+            ok = step.expected_status is None or status == step.expected_status
+            if ok:
+                for extractor in step.extractors:
+                    variables[extractor.variable] = extractor.extract(response)
+        except Exception as e:
+            latency = time.monotonic() - started
+            status = type(e).__name__
+            ok = False
+
+        stats = self.stats[step.name]
+        with self.lock:
+            stats.latencies.append(latency)
+            stats.statuses[status] += 1
+            if not ok:
+                stats.errors += 1
+        return ok
+
+    def virtual_user(self, stop):
+        session = self.session_factory()
+        variables = dict(self.environment)
+        # при снижении нагрузки пользователь доходит итерацию до конца, по окончании прогона - нет
+        while not stop.is_set() and not self.finished.is_set():
+            for step in self.steps:
+                if self.finished.is_set() or not self.execute(session, step, variables):
+                    break
+                if self.think_time:
+                    time.sleep(self.think_time)
+            else:
+                with self.lock:
+                    self.iterations += 1
+        session.close()
+
+    def run(self):
+        total = sum(duration for duration, _ in self.stages)
+        active, threads = [], []
+        started = time.monotonic()
+        next_report = self.report_interval
+        while True:
+            elapsed = time.monotonic() - started
+            if elapsed >= total:
+                break
+            target = target_users(self.stages, elapsed)
+            while len(active) < target:
+                stop = threading.Event()
+                thread = threading.Thread(target=self.virtual_user, args=(stop,),
+                                          name=f"vu-{len(threads)}", daemon=True)
+                thread.start()
+                active.append(stop)
+                threads.append(thread)
+            while len(active) > target:
+                active.pop().set()
+            if next_report is not None and elapsed >= next_report:
+                print(self.progress(elapsed, len(active)))
+                next_report += self.report_interval
+            time.sleep(self.tick)
+
+        self.finished.set()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.monotonic() - started
+        return self
+
+    def progress(self, elapsed, users):
+        with self.lock:
+            requests_count = sum(len(s.latencies) for s in self.stats.values())
+            errors = sum(s.errors for s in self.stats.values())
+        return (f"{elapsed:6.1f} s: {users} users, {requests_count} requests, "
+                f"{errors} errors, {self.iterations} iterations")
+
+    def summary(self):
+        """
+        Сводка по шагам: число запросов, ошибки, запросов в секунду и перцентили задержки в мс
+        """
+        result = {}
+        for name, stats in self.stats.items():
+            latencies = sorted(stats.latencies)
+            result[name] = {
+                "count": len(latencies),
+                "errors": stats.errors,
+                "rps": len(latencies) / self.elapsed if self.elapsed else 0.0,
+                "statuses": {str(k): v for k, v in stats.statuses.items()},
+                **{f"p{p}": percentile(latencies, p) * 1000 for p in PERCENTILES},
+                "max": (latencies[-1] if latencies else 0.0) * 1000,
+            }
+        return result
+
+    def report(self):
+        columns = ["count", "errors", "rps"] + [f"p{p}" for p in PERCENTILES] + ["max"]
+        lines = [f"{'step':<45}" + "".join(f"{c:>9}" for c in columns)]
+        for name, row in self.summary().items():
+            lines.append(f"{name:<45}" + "".join(
+                f"{row[c]:>9}" if isinstance(row[c], int) else f"{row[c]:>9.1f}" for c in columns
+            ))
+        lines.append(f"{self.iterations} full iterations in {self.elapsed:.1f} s (latency in ms)")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон коллекции Postman")
+    parser.add_argument("--collection", default="postman_tests/postman-collection.json")
+    parser.add_argument("--environment", default="postman_tests/postman-local-environment.json")
+    parser.add_argument("--folder", action="append", help="папка коллекции (можно несколько), по умолчанию все")
+    parser.add_argument("--var", action="append", default=[], help="переопределить переменную: key=value")
+    parser.add_argument("--stages", default="10s:5,30s:20,10s:0",
+                        help="расписание нагрузки: длительность:пользователей через запятую")
+    parser.add_argument("--think-time", type=float, default=0.0, help="пауза между шагами, с")
+    parser.add_argument("--timeout", type=float, default=10.0, help="таймаут запроса, с")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="как часто печатать прогресс, с")
+    parser.add_argument("--output", help="сохранить сводку в JSON")
+    args = parser.parse_args()
+
+    environment = load_environment(args.environment)
+    environment.update(var.split("=", 1) for var in args.var)
+    steps = load_collection(args.collection, args.folder)
+    print(f"Loaded {len(steps)} steps from {args.collection}")
+
+    run = LoadRun(steps, environment, parse_stages(args.stages), timeout=args.timeout,
+                  think_time=args.think_time, report_interval=args.report_interval).run()
+    print(run.report())
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run.summary(), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
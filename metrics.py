@@ -0,0 +1,34 @@
+import threading
+
+from flask import jsonify
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def inc(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def gauge(name, getter):
+    """
+    Зарегистрировать значение, которое вычисляется вызовом getter() при каждом чтении метрик
+    """
+    _gauges[name] = getter
+
+
+def snapshot():
+    with _lock:
+        result = dict(_counters)
+    for name, getter in list(_gauges.items()):
+        result[name] = getter()
+    return result
+
+
+def init_app(app):
+    """
+    Добавить в приложение GET /manage/metrics со всеми счетчиками процесса
+    """
+    app.add_url_rule("/manage/metrics", "metrics", lambda: (jsonify(snapshot()), 200), methods=["GET"])
@@ -0,0 +1,114 @@
+"""
+Все четыре сервиса в одном процессе.
+
+Внешний API тот же, что у store_service, а запросы между сервисами
+не уходят в сеть: адаптер requests вызывает нужное WSGI-приложение напрямую.
+Адреса сервисов ($ORDER_SERVICE_URL и т.д.) настраиваются как обычно
+"""
+import os
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+from werkzeug.serving import run_simple
+
+import database
+import service_client
+import store_service
+import order_service
+import warehouse_service
+import warranty_service
+
+ROOT_PATH = "/api/v1"
+ROUTES = [
+    (f"{ROOT_PATH}/store", store_service.app),
+    (f"{ROOT_PATH}/orders", order_service.app),
+    (f"{ROOT_PATH}/warehouse", warehouse_service.app),
+    (f"{ROOT_PATH}/warranty", warranty_service.app),
+    (f"{ROOT_PATH}/admin/orders", order_service.app),
+    (f"{ROOT_PATH}/admin/warranty", warranty_service.app),
+]
+SERVICE_URLS = [
+    (store_service.ORDER_SERVICE_URL, order_service.app),
+    (store_service.WAREHOUSE_SERVICE_URL, warehouse_service.app),
+    (store_service.WARRANTY_SERVICE_URL, warranty_service.app),
+]
+
+
+class InProcessAdapter(BaseAdapter):
+    """
+    Транспорт requests, который отдает запрос WSGI-приложению в этом же потоке
+    """
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        builder = EnvironBuilder(
+            path=url.path,
+            query_string=url.query,
+            method=request.method,
+            headers=dict(request.headers),
+            data=body,
+        )
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+        app_iter, status, headers = run_wsgi_app(self.app, environ, buffered=True)
+        try:
+            content = b"".join(app_iter)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+        response = requests.Response()
+        response.status_code = int(status.split(" ", 1)[0])
+        response.reason = status.split(" ", 1)[1] if " " in status else ""
+        response.headers = CaseInsensitiveDict(headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def dispatch(environ, start_response):
+    path = environ.get("PATH_INFO", "")
+    for prefix, app in ROUTES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return app(environ, start_response)
+    return store_service.app(environ, start_response)
+
+
+def install_transport(session=service_client.session):
+    for url, app in SERVICE_URLS:
+        session.mount(f"http://{url}/", InProcessAdapter(app))
+
+
+def uninstall_transport(session=service_client.session):
+    for url, _ in SERVICE_URLS:
+        session.adapters.pop(f"http://{url}/", None)
+
+
+if __name__ == '__main__':
+    PORT = int(os.environ.get("PORT", 7777))
+    print("LISTENING ON PORT:", PORT, "($PORT)")
+    database.create_schema()
+    store_service.refresh_items_in_db()
+    warehouse_service.refresh_items_in_db()
+    for _, app in ROUTES:
+        app.url_map.strict_slashes = False
+    install_transport()
+    run_simple("0.0.0.0", PORT, dispatch, threaded=True)
@@ -1,21 +1,44 @@
 import os
 from uuid import uuid4
 from enum import Enum
-from datetime import date
+from datetime import date, datetime, timedelta
 
 from pydantic import BaseModel, ValidationError
-from flask import Flask, request, jsonify
+from flask import Flask, request
 import sqlalchemy as sa
 import requests
 
 import database
+import metrics
+import admission
+import service_client
+import wire
+import profiling
+import archive
+import admin
+import export
+import changefeed
+import cache
 
 app = Flask(__name__)
+metrics.init_app(app)
+admission.init_app(app, "order")
+wire.init_app(app)
+profiling.init_app(app, "order")
+service_client.init_app(app)
 ROOT_PATH = "/api/v1"
 WAREHOUSE_SERVICE_URL = os.environ.get("WAREHOUSE_SERVICE_URL", "localhost:8280")
 print(f"Warehouse service url: {WAREHOUSE_SERVICE_URL} ($WAREHOUSE_SERVICE_URL)")
 WARRANTY_SERVICE_URL = os.environ.get("WARRANTY_SERVICE_URL", "localhost:8180")
 print(f"Warranty service url: {WARRANTY_SERVICE_URL} ($WARRANTY_SERVICE_URL)")
+ORDER_CACHE_SIZE = int(os.environ.get("ORDER_CACHE_SIZE", 10000))
+ORDER_CACHE_TTL = float(os.environ.get("ORDER_CACHE_TTL", 60))
+print(f"Order cache: {ORDER_CACHE_SIZE} orders for {ORDER_CACHE_TTL} s ($ORDER_CACHE_SIZE, $ORDER_CACHE_TTL)")
+# order_uid -> {"shard", "user_uid", "item_uid", "json"}. Кеш у каждого процесса свой,
+# поэтому удаление в другом процессе станет видно здесь не позже чем через ORDER_CACHE_TTL
+order_cache = cache.TTLCache("order", ORDER_CACHE_SIZE, ORDER_CACHE_TTL)
+ORDER_RETURN_LEASE_SECONDS = float(os.environ.get("ORDER_RETURN_LEASE_SECONDS", 60))
+print(f"Order return lease: {ORDER_RETURN_LEASE_SECONDS} s ($ORDER_RETURN_LEASE_SECONDS)")
 
 
 class Order(database.Base):
@@ -26,6 +49,29 @@ class Order(database.Base):
     order_uid = sa.Column(sa.Text, unique=True)
     status = sa.Column(sa.VARCHAR(255))
     user_uid = sa.Column(sa.Text)
+    # до какого времени возврат (статус WAITING) принадлежит начавшему его запросу
+    waiting_until = sa.Column(sa.TIMESTAMP, nullable=True)
+
+
+OrderArchive = database.archive_table(Order.__table__, "order_uid", "user_uid")
+
+
+user_orders_query = database.bakery(
+    lambda s: s.query(Order.order_uid, Order.order_date, Order.item_uid, Order.status)
+)
+user_orders_query += lambda q: q.filter(Order.user_uid == sa.bindparam("user_uid"))
+order_changes = changefeed.ChangeFeed("order_changes", sharded=True)
+order_changes.init_app(app, f"{ROOT_PATH}/orders/changes")
+
+
+class OrderLocation(database.Base):
+    """
+    Индекс order_uid -> шард, хранится в DATABASE_URL. Нужен только для заказов,
+    шард которых не записан в order_uid: старых и перенесенных shard_rebalance
+    """
+    __tablename__ = 'order_location'
+    order_uid = sa.Column(sa.Text, primary_key=True)
+    shard = sa.Column(sa.Integer)
 
 
 class NewOrderRequest(BaseModel):
@@ -43,6 +89,87 @@ class Status(str, Enum):
     waiting = "WAITING"
 
 
+def archive_orders(cutoff, **kwargs):
+    return sum(
+        archive.archive_rows(Order.__table__, OrderArchive, Order.order_date < cutoff, shard=shard, **kwargs)
+        for shard in range(len(database.shard_engines))
+    )
+
+
+def new_order_uid(shard):
+    """
+    uuid4, в первых четырех hex-цифрах которого записан номер шарда заказа
+    """
+    return f"{shard:04x}{str(uuid4())[4:]}"
+
+
+def order_uid_shard(order_uid):
+    """
+    Шард, записанный в order_uid (см. new_order_uid), или None
+    """
+    try:
+        shard = int(order_uid[:4], 16)
+    except ValueError:
+        return None
+    return shard if shard < len(database.shard_engines) else None
+
+
+def find_order_shard(order_uid):
+    """
+    Шард, в котором лежит заказ order_uid: сначала записанный в order_uid,
+    затем из OrderLocation, заказы без записи в индексе ищутся по всем шардам
+    """
+    encoded_shard = order_uid_shard(order_uid)
+    if encoded_shard is not None:
+        with database.Session(encoded_shard) as s:
+            if s.query(Order.id).filter(Order.order_uid == order_uid).first():
+                return encoded_shard
+
+    with database.Session() as s:
+        location = s.query(OrderLocation).get(order_uid)
+        if location:
+            return location.shard
+
+    for shard in range(len(database.shard_engines)):
+        if shard == encoded_shard:
+            continue
+        with database.Session(shard) as s:
+            if s.query(Order.id).filter(Order.order_uid == order_uid).first():
+                return shard
+    return None
+
+
+def order_to_json(order):
+    return {
+        "orderUid": order.order_uid,
+        "orderDate": order.order_date.isoformat(),
+        "itemUid": order.item_uid,
+        "status": order.status
+    }
+
+
+def cache_order(shard, order):
+    cached = {
+        "shard": shard,
+        "user_uid": order.user_uid,
+        "item_uid": order.item_uid,
+        "json": order_to_json(order),
+    }
+    order_cache.set(order.order_uid, cached)
+    return cached
+
+
+@app.before_request
+def reset_db_hold_time():
+    database.reset_hold_time()
+
+
+@app.after_request
+def report_db_hold_time(response):
+    response.headers["Server-Timing"] = f"db-hold;dur={database.hold_time() * 1000:.2f}"
+    return response
+
+
 @app.route("/manage/health", methods=["GET"])
 def health_check():
     return "UP", 200
@@ -54,18 +181,19 @@ def request_new_order(user_uid):
     Сделать заказ от имени пользователя
     """
     try:
-        new_item_request = NewOrderRequest.parse_obj(request.get_json(force=True))
+        new_item_request = NewOrderRequest.parse_obj(wire.get_payload())
     except ValidationError as e:
         return {"message": e.errors()}, 400
 
-    order_uid = str(uuid4())
+    shard = database.shard_for(user_uid)
+    order_uid = new_order_uid(shard)
 
-    if not requests.get(f"http://{WAREHOUSE_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{WAREHOUSE_SERVICE_URL}/manage/health").ok:
         return {"message": "Warehouse sevice unavailable"}, 422
-    if not requests.get(f"http://{WARRANTY_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{WARRANTY_SERVICE_URL}/manage/health").ok:
         return {"message": "Warranty sevice unavailable"}, 422
 
-    warehouse_service_response = requests.post(
+    warehouse_service_response = service_client.post(
         f"http://{WAREHOUSE_SERVICE_URL}{ROOT_PATH}/warehouse",
         json={
             "orderUid": order_uid,
@@ -77,20 +205,21 @@ def request_new_order(user_uid):
         return {"message": f"bad response from warehouse "
                            f"({warehouse_service_response.status_code}): "
                            f"{warehouse_service_response.text}"}, 422
-    elif not warehouse_service_response.json().get("orderItemUid"):
+    elif not service_client.payload(warehouse_service_response).get("orderItemUid"):
         return {"message": "Something terrible happens to warehouse :/"}, 500
-    item_uid = warehouse_service_response.json().get("orderItemUid")
+    item_uid = service_client.payload(warehouse_service_response).get("orderItemUid")
 
-    requests.post(f"http://{WARRANTY_SERVICE_URL}{ROOT_PATH}/warranty/{item_uid}")
+    service_client.post(f"http://{WARRANTY_SERVICE_URL}{ROOT_PATH}/warranty/{item_uid}")
 
-    with database.Session() as s:
+    with database.Session(shard) as s:
         s.add(Order(
-            item_uid=warehouse_service_response.json()["orderItemUid"],
+            item_uid=service_client.payload(warehouse_service_response)["orderItemUid"],
             order_date=date.today(),
             order_uid=order_uid,
             status=Status.paid,
             user_uid=user_uid,
         ))
+        order_changes.record(s, order_uid, "created", Status.paid.value)
 
     return {"orderUid": order_uid}, 200
 
@@ -100,39 +229,47 @@ def request_order(user_uid, order_uid):
     """
     Получить информацию по конкретному заказу пользователя
     """
-    with database.Session() as s:
+    cached = order_cache.get(order_uid)
+    if cached and cached["user_uid"] == user_uid:
+        return cached["json"], 200
+
+    shard = database.shard_for(user_uid)
+    session = database.Session(shard, readonly=True)
+    with session as s:
         order = (
             s.query(Order)
             .filter(Order.order_uid == order_uid)
             .filter(Order.user_uid == user_uid)
             .one_or_none()
         )
-        if not order:
-            return {"message": "Not found"}, 404
+        if order and session.from_replica:
+            # отстающая реплика могла отдать уже удаленный заказ - в кеш его не кладем
+            return order_to_json(order), 200
+        if order:
+            return cache_order(shard, order)["json"], 200
 
-        return {
-            "orderUid": order.order_uid,
-            "orderDate": order.order_date.isoformat(),
-            "itemUid": order.item_uid,
-            "status": order.status
-        }, 200
+    archived = archive.find_archived(Order.__table__, OrderArchive, shard=shard,
+                                     order_uid=order_uid, user_uid=user_uid)
+    if not archived:
+        return {"message": "Not found"}, 404
+    return cache_order(shard, archived[0])["json"], 200
 
 
 @app.route(f"{ROOT_PATH}/orders/<string:user_uid>", methods=["GET"])
 def request_all_orders(user_uid):
     """
-    Получить все заказы пользователя
+    Получить все заказы пользователя.
+    includeArchived=true - добавить заказы из архива (медленно)
     """
-    with database.Session() as s:
-        orders = s.query(Order).filter(Order.user_uid == user_uid).all()
+    shard = database.shard_for(user_uid)
+    with database.Session(shard, readonly=True) as s:
+        orders = user_orders_query(s).params(user_uid=user_uid).all()
+        result = [order_to_json(order) for order in orders]
 
-        result = [{
-            "orderUid": order.order_uid,
-            "orderDate": order.order_date.isoformat(),
-            "itemUid": order.item_uid,
-            "status": order.status
-        } for order in orders]
-        return jsonify(result), 200
+    if request.args.get("includeArchived") == "true":
+        archived = archive.find_archived(Order.__table__, OrderArchive, shard=shard, user_uid=user_uid)
+        result.extend(order_to_json(order) for order in archived)
+    return wire.jsonify(result), 200
 
 
 @app.route(f"{ROOT_PATH}/orders/<string:order_uid>/warranty", methods=["POST"])
@@ -141,51 +278,144 @@ def request_warranty(order_uid):
     Запрос гарантии по заказу
     """
     try:
-        warranty_request = WarrantyRequest.parse_obj(request.get_json(force=True))
+        warranty_request = WarrantyRequest.parse_obj(wire.get_payload())
     except ValidationError as e:
         return {"message": e.errors()}, 400
 
-    if not requests.get(f"http://{WAREHOUSE_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{WAREHOUSE_SERVICE_URL}/manage/health").ok:
         return {"message": "Warehouse sevice unavailable"}, 422
 
-    with database.Session() as s:
-        order = s.query(Order).filter(Order.order_uid == order_uid).one_or_none()
-        if not order:
+    cached = order_cache.get(order_uid)
+    if not cached:
+        service_client.check_deadline()
+        shard = find_order_shard(order_uid)
+        if shard is None:
             return {"message": "Order not found"}, 404
 
-        warehouse_service_response = requests.post(
-            f"http://{WAREHOUSE_SERVICE_URL}{ROOT_PATH}/warehouse/{order.item_uid}/warranty",
-            json={"reason": warranty_request.reason}
-        )
-        if not warehouse_service_response.ok:
-            return {"message": "Warranty not found"}, 404
+        with database.Session(shard) as s:
+            order = s.query(Order).filter(Order.order_uid == order_uid).one_or_none()
+            if not order:
+                return {"message": "Order not found"}, 404
+            cached = cache_order(shard, order)
+    item_uid = cached["item_uid"]
+
+    warehouse_service_response = service_client.post(
+        f"http://{WAREHOUSE_SERVICE_URL}{ROOT_PATH}/warehouse/{item_uid}/warranty",
+        json={"reason": warranty_request.reason}
+    )
+    if not warehouse_service_response.ok:
+        return {"message": "Warranty not found"}, 404
+
+    return service_client.payload(warehouse_service_response), 200
+
 
-    return warehouse_service_response.json(), 200
+def set_order_status(shard, order_uid, status, expected_status, expected_waiting_until=None, waiting_until=None):
+    """
+    Сменить статус заказа, только если он сейчас expected_status (для WAITING - еще и с той же
+    арендой expected_waiting_until). Возвращает, получилось ли
+    """
+    with database.Session(shard) as s:
+        query = s.query(Order).filter(Order.order_uid == order_uid).filter(Order.status == expected_status)
+        if expected_status == Status.waiting:
+            query = query.filter(
+                Order.waiting_until.is_(None) if expected_waiting_until is None
+                else Order.waiting_until == expected_waiting_until
+            )
+        updated = bool(query.update({Order.status: status, Order.waiting_until: waiting_until},
+                                    synchronize_session=False))
+        if updated:
+            order_changes.record(s, order_uid, "status", status)
+    # после commit: иначе параллельное чтение успеет положить в кеш старый статус
+    order_cache.invalidate(order_uid)
+    return updated
 
 
 @app.route(f"{ROOT_PATH}/orders/<string:order_uid>", methods=["DELETE"])
 def request_delete_order(order_uid):
     """
     Вернуть заказ
+
+    Соединение с базой не держится во время запроса к складу: заказ сначала
+    помечается WAITING с арендой на $ORDER_RETURN_LEASE_SECONDS, затем идет запрос к складу,
+    после чего заказ удаляется, а если склад ответил ошибкой - возвращается прежний статус.
+
+    Если склад не ответил вовремя, он мог уже вернуть товар, поэтому заказ остается WAITING.
+    Возврат с истекшей арендой (таймаут или упавший процесс) может перехватить следующий запрос:
+    DELETE на складе идемпотентен, а статус до WAITING всегда PAID
     """
-    with database.Session() as s:
+    shard = find_order_shard(order_uid)
+    if shard is None:
+        return {"message": "Order not found"}, 404
+
+    with database.Session(shard) as s:
         order = s.query(Order).filter(Order.order_uid == order_uid).one_or_none()
         if not order:
             return {"message": "Order not found"}, 404
+        item_uid = order.item_uid
+        previous_status = order.status
+        previous_lease = order.waiting_until
+
+    if previous_status == Status.waiting:
+        if previous_lease is not None and previous_lease > datetime.now():
+            return {"message": "Order is already being returned"}, 409
+        metrics.inc("order.return_lease_taken_over")
+        restore_status = Status.paid
+    else:
+        restore_status = previous_status
+
+    if not service_client.get(f"http://{WAREHOUSE_SERVICE_URL}/manage/health").ok:
+        return {"message": "Warehouse sevice unavailable"}, 422
+    service_client.check_deadline()
 
-        if not requests.get(f"http://{WAREHOUSE_SERVICE_URL}/manage/health").ok:
-            return {"message": "Warehouse sevice unavailable"}, 422
+    lease = datetime.now() + timedelta(seconds=ORDER_RETURN_LEASE_SECONDS)
+    if not set_order_status(shard, order_uid, Status.waiting, expected_status=previous_status,
+                            expected_waiting_until=previous_lease, waiting_until=lease):
+        return {"message": "Order is already being returned"}, 409
 
-        warehouse_service_response = requests.delete(
-            f"http://{WAREHOUSE_SERVICE_URL}{ROOT_PATH}/warehouse/{order.item_uid}",
+    try:
+        warehouse_service_response = service_client.delete(
+            f"http://{WAREHOUSE_SERVICE_URL}{ROOT_PATH}/warehouse/{item_uid}",
         )
-        if not warehouse_service_response.ok:
-            return {"message": "Order not found on warehouse"}, 422
+    except service_client.DEADLINE_ERRORS:
+        # исход неизвестен: заказ остается WAITING до конца аренды
+        raise
+    except requests.RequestException:
+        set_order_status(shard, order_uid, restore_status, expected_status=Status.waiting,
+                         expected_waiting_until=lease)
+        raise
+    if not warehouse_service_response.ok:
+        set_order_status(shard, order_uid, restore_status, expected_status=Status.waiting,
+                         expected_waiting_until=lease)
+        return {"message": "Order not found on warehouse"}, 422
 
-        s.delete(order)
+    with database.Session(shard) as s:
+        deleted = (
+            s.query(Order)
+            .filter(Order.order_uid == order_uid)
+            .filter(Order.status == Status.waiting)
+            .filter(Order.waiting_until == lease)
+            .delete(synchronize_session=False)
+        )
+        if deleted:
+            order_changes.record(s, order_uid, "deleted")
+    order_cache.invalidate(order_uid)
+    if order_uid_shard(order_uid) != shard:
+        with database.Session() as s:
+            s.query(OrderLocation).filter(OrderLocation.order_uid == order_uid).delete()
     return '', 204
 
 
+@app.route(f"{ROOT_PATH}/admin/orders/export", methods=["GET"])
+@admission.exempt
+@admin.admin_required
+def request_export_orders():
+    """
+    Выгрузка всех заказов в NDJSON (для аналитики)
+    """
+    return export.export_ndjson(Order.__table__, "order_date", archive=OrderArchive,
+                                shards=range(len(database.shard_engines)))
+
+
 if __name__ == '__main__':
     PORT = os.environ.get("PORT", 7777)
     print("LISTENING ON PORT:", PORT, "($PORT)")
@@ -0,0 +1,160 @@
+"""
+Профилирование запросов по требованию.
+
+Запрос с заголовками X-Profile и X-Admin-Token выполняется под cProfile:
+X-Profile: inline - вместо ответа возвращается текстовая статистика pstats,
+X-Profile: 1 - ответ обычный, профиль сохраняется в $PROFILE_DIR (путь в X-Profile-File).
+
+Если задан $PROFILE_SAMPLE_INTERVAL_MS, фоновый поток периодически снимает стеки
+потоков, обрабатывающих запросы; GET /manage/profile отдает их в формате
+collapsed stacks для flamegraph.pl / speedscope (?reset=true - очистить)
+"""
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+
+from flask import request, Response
+
+import admin
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 0))
+print(f"Profile sampling interval: {PROFILE_SAMPLE_INTERVAL_MS} ms ($PROFILE_SAMPLE_INTERVAL_MS, 0 - disabled)")
+
+
+class Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = Counter()
+        self.stacks = Counter()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self.thread.start()
+
+    def enter(self):
+        with self.lock:
+            self.active[threading.get_ident()] += 1
+
+    def exit(self):
+        with self.lock:
+            ident = threading.get_ident()
+            self.active[ident] -= 1
+            if self.active[ident] <= 0:
+                del self.active[ident]
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self.lock:
+            idents = list(self.active)
+        for ident in idents:
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                with self.lock:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+    def collapsed(self, reset=False):
+        with self.lock:
+            text = "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+            if reset:
+                self.stacks.clear()
+        return text
+
+
+sampler = Sampler(PROFILE_SAMPLE_INTERVAL_MS / 1000) if PROFILE_SAMPLE_INTERVAL_MS > 0 else None
+
+
+class ProfilingMiddleware:
+    """
+    WSGI-обертка: профилирует весь запрос, включая Flask и сериализацию ответа
+    """
+
+    def __init__(self, wsgi_app, name):
+        self.wsgi_app = wsgi_app
+        self.name = name
+
+    def __call__(self, environ, start_response):
+        if sampler is not None:
+            sampler.enter()
+        try:
+            mode = environ.get("HTTP_X_PROFILE")
+            if mode and admin.check_token(environ.get("HTTP_X_ADMIN_TOKEN", "")):
+                return self.profile(environ, start_response, inline=(mode == "inline"))
+            return self.wsgi_app(environ, start_response)
+        finally:
+            if sampler is not None:
+                sampler.exit()
+
+    def profile(self, environ, start_response, inline):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured["status"], captured["headers"] = status, headers
+            return lambda data: None
+
+        def run():
+            app_iter = self.wsgi_app(environ, capture)
+            try:
+                return b"".join(app_iter)
+            finally:
+                if hasattr(app_iter, "close"):
+                    app_iter.close()
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # другой профилировщик уже активен (Python 3.12+ разрешает только один)
+            body = run()
+            start_response(captured["status"], captured["headers"] + [("X-Profile-Error", "profiler busy")])
+            return [body]
+        try:
+            body = run()
+        finally:
+            profiler.disable()
+
+        if inline:
+            stats_text = io.StringIO()
+            pstats.Stats(profiler, stream=stats_text).sort_stats("cumulative").print_stats(50)
+            start_response("200 OK", [("Content-Type", "text/plain; charset=utf-8"),
+                                      ("X-Profiled-Status", captured["status"])])
+            return [stats_text.getvalue().encode("utf-8")]
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns()}.prof")
+        profiler.dump_stats(path)
+        start_response(captured["status"], captured["headers"] + [("X-Profile-File", path)])
+        return [body]
+
+
+def init_app(app, name):
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, name)
+    if sampler is not None:
+        sampler.start()
+
+    @admin.admin_required
+    def request_profile():
+        if sampler is None:
+            return {"message": "Sampling is disabled, set $PROFILE_SAMPLE_INTERVAL_MS"}, 404
+        return Response(sampler.collapsed(reset=request.args.get("reset") == "true"), mimetype="text/plain")
+
+    app.add_url_rule("/manage/profile", "request_profile", request_profile, methods=["GET"])
@@ -0,0 +1,147 @@
+import os
+import time
+
+import requests
+from flask import g, has_request_context, request
+
+import database
+import singleflight
+import wire
+
+DEADLINE_HEADER = "X-Request-Budget-Ms"
+CLIENT_HEADER = "X-Client-Id"
+SERVICE_CLIENT_TIMEOUT = float(os.environ.get("SERVICE_CLIENT_TIMEOUT", 10))
+print(f"Service client timeout: {SERVICE_CLIENT_TIMEOUT} s ($SERVICE_CLIENT_TIMEOUT)")
+
+session = requests.Session()
+_get_calls = singleflight.Group("service_client")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+# ошибки, после которых запрос, присоединившийся к чужому вызову, повторяет его со своим бюджетом
+DEADLINE_ERRORS = (DeadlineExceeded, requests.Timeout)
+
+
+def remaining():
+    """
+    Сколько секунд осталось до дедлайна текущего запроса, None - дедлайна нет
+    """
+    if not has_request_context() or g.get("deadline") is None:
+        return None
+    return g.deadline - time.monotonic()
+
+
+def check_deadline():
+    """
+    Бросить DeadlineExceeded (504), если бюджет запроса исчерпан: вызывается перед работой с базой,
+    которая идет после запросов к другим сервисам
+    """
+    budget = remaining()
+    if budget is not None and budget <= 0:
+        raise DeadlineExceeded()
+
+
+def payload(response):
+    """
+    Разобранное тело ответа (MessagePack или JSON)
+    """
+    if not hasattr(response, "payload"):
+        if response.headers.get("Content-Type", "").startswith(wire.MSGPACK_MIMETYPE):
+            response.payload = wire.loads(response.content)
+        else:
+            response.payload = response.json()
+    return response.payload
+
+
+def call(method, url, headers=None, json=None, timeout=None, **kwargs):
+    """
+    Запрос к другому сервису: таймаут равен остатку бюджета текущего запроса
+    (но не больше timeout, если он задан), остаток передается дальше в заголовке X-Request-Budget-Ms.
+    Тело json и ответ передаются в MessagePack, если он установлен.
+    Клиент текущего запроса (для read-your-writes) передается в X-Client-Id
+    """
+    budget = remaining()
+    headers = {"Accept": wire.ACCEPT, **(headers or {})}
+    if database.current_client() is not None:
+        headers.setdefault(CLIENT_HEADER, database.current_client())
+    if json is not None:
+        if wire.msgpack is not None:
+            kwargs["data"] = wire.dumps(json)
+            headers["Content-Type"] = wire.MSGPACK_MIMETYPE
+        else:
+            kwargs["json"] = json
+    if budget is not None and budget <= 0:
+        raise DeadlineExceeded()
+    if timeout is not None:
+        budget = timeout if budget is None else min(budget, timeout)
+    if budget is None:
+        budget = SERVICE_CLIENT_TIMEOUT
+    else:
+        headers[DEADLINE_HEADER] = str(int(budget * 1000))
+    return session.request(method, url, headers=headers, timeout=budget, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    """
+    Одновременные GET на один и тот же url выполняются одним запросом.
+    Чужой запрос ждем не дольше своего бюджета; если он упал по своему дедлайну - повторяем
+    """
+    key = (url, tuple(sorted((params or {}).items())))
+    try:
+        return _get_calls.do(key, lambda: call("GET", url, params=params, **kwargs),
+                             timeout=remaining(), retry_on=DEADLINE_ERRORS)
+    except singleflight.WaitTimeout:
+        raise DeadlineExceeded()
+
+
+def post(url, **kwargs):
+    return call("POST", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return call("DELETE", url, **kwargs)
+
+
+def init_app(app, default_budget=None):
+    """
+    Дедлайн запроса берется из X-Request-Budget-Ms, но не больше default_budget (секунды), если он задан;
+    нечисловой заголовок считается отсутствующим.
+    Запросы с исчерпанным бюджетом сразу получают 504.
+    Клиент запроса для database.set_client - X-Client-Id или user_uid из пути
+    """
+    @app.before_request
+    def set_client():
+        # в монолите вызовы других сервисов - вложенные запросы в том же потоке,
+        # после них нужно вернуть клиента внешнего запроса
+        g.setdefault("previous_clients", []).append(database.current_client())
+        database.set_client(request.headers.get(CLIENT_HEADER) or (request.view_args or {}).get("user_uid"))
+
+    @app.teardown_request
+    def reset_client(exc):
+        previous_clients = g.get("previous_clients")
+        if previous_clients:
+            database.set_client(previous_clients.pop())
+
+    @app.before_request
+    def start_deadline():
+        try:
+            budget = int(request.headers[DEADLINE_HEADER]) / 1000
+        except (KeyError, ValueError):
+            budget = None
+        if default_budget:
+            budget = default_budget if budget is None else min(budget, default_budget)
+        if budget is not None:
+            g.deadline = time.monotonic() + budget
+        budget = remaining()
+        if budget is not None and budget <= 0:
+            return {"message": "Deadline exceeded"}, 504
+        return None
+
+    @app.errorhandler(DeadlineExceeded)
+    @app.errorhandler(singleflight.WaitTimeout)
+    @app.errorhandler(requests.Timeout)
+    def deadline_exceeded(e):
+        return {"message": "Deadline exceeded"}, 504
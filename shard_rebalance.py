@@ -0,0 +1,130 @@
+import argparse
+from collections import defaultdict
+
+import sqlalchemy as sa
+
+import archive
+import database
+from order_service import Order, OrderArchive, OrderLocation, order_uid_shard
+
+
+def rebalance(old_urls, new_urls, batch_size=1000):
+    """
+    Перераспределить заказы (и архивные заказы) со старого списка шардов на новый по shard_for(user_uid).
+
+    Заказ сначала копируется на новый шард, потом удаляется со старого, поэтому
+    прерванный запуск можно просто повторить. Возвращает число перенесенных заказов.
+    После окончания нужно перезапустить order_service с SHARD_URLS=new_urls
+    """
+    engines = {url: sa.create_engine(url) for url in set(old_urls) | set(new_urls)}
+    for engine in engines.values():
+        database.Base.metadata.create_all(engine, checkfirst=True)
+
+    moved = 0
+    for table in (Order.__table__, OrderArchive):
+        for old_url in old_urls:
+            moved += rebalance_table(table, engines, old_url, new_urls, batch_size)
+    rebalance_archive_index(engines, old_urls, new_urls)
+    return moved
+
+
+def rebalance_table(table, engines, old_url, new_urls, batch_size):
+    locations = OrderLocation.__table__
+    source = engines[old_url]
+    last_id = 0
+    moved = 0
+    while True:
+        with source.connect() as connection:
+            rows = [dict(row) for row in connection.execute(
+                sa.select(table.columns)
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            )]
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        by_target = defaultdict(list)
+        for row in rows:
+            by_target[database.shard_for(row["user_uid"], len(new_urls))].append(row)
+
+        for new_shard, target_rows in by_target.items():
+            if new_urls[new_shard] != old_url:
+                move_orders(table, source, engines[new_urls[new_shard]], target_rows)
+                moved += len(target_rows)
+            if table is not Order.__table__:
+                # архивные заказы ищутся только по user_uid, индекс order_location им не нужен
+                continue
+            with database.Session() as s:
+                s.execute(locations.delete().where(
+                    locations.c.order_uid.in_([row["order_uid"] for row in target_rows])
+                ))
+                # шард, записанный в order_uid, может больше не совпадать с новым
+                moved_locations = [
+                    {"order_uid": row["order_uid"], "shard": new_shard}
+                    for row in target_rows if order_uid_shard(row["order_uid"]) != new_shard
+                ]
+                if moved_locations:
+                    s.execute(locations.insert(), moved_locations)
+    print(f"Shard {old_url}: {table.name} processed up to id {last_id}, moved {moved} rows")
+    return moved
+
+
+def move_orders(table, source, target, rows):
+    order_uids = [row["order_uid"] for row in rows]
+    with target.begin() as connection:
+        existing = {uid for uid, in connection.execute(
+            sa.select([table.c.order_uid]).where(table.c.order_uid.in_(order_uids))
+        )}
+        new_rows = [
+            {key: value for key, value in row.items() if key != "id"}
+            for row in rows if row["order_uid"] not in existing
+        ]
+        if new_rows and table.c.id.autoincrement is False:
+            # id архивной таблицы не генерируется базой, а id разных шардов пересекаются
+            next_id = (connection.execute(sa.select([sa.func.max(table.c.id)])).scalar() or 0) + 1
+            for i, row in enumerate(new_rows):
+                row["id"] = next_id + i
+        if new_rows:
+            connection.execute(table.insert(), new_rows)
+    with source.begin() as connection:
+        connection.execute(table.delete().where(table.c.order_uid.in_(order_uids)))
+
+
+def rebalance_archive_index(engines, old_urls, new_urls):
+    """
+    Перестроить archive_file для NDJSON-архива заказов: строки файла попадают в индекс нового шарда
+    """
+    files = database.archive_files
+    table = Order.__table__
+    for url in set(old_urls) | set(new_urls):
+        with engines[url].begin() as connection:
+            connection.execute(files.delete().where(files.c.table_name == table.name))
+
+    for name, rows in archive.read_ndjson(table):
+        by_target = defaultdict(list)
+        for row in rows:
+            by_target[database.shard_for(row["user_uid"], len(new_urls))].append(row)
+        for new_shard, target_rows in by_target.items():
+            entries = archive.index_entries(table, OrderArchive, target_rows, name)
+            if entries:
+                with engines[new_urls[new_shard]].begin() as connection:
+                    connection.execute(files.insert(), entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перераспределение заказов между шардами")
+    parser.add_argument("--from-urls", default=",".join(database.SHARD_URLS or [database.DATABASE_URL]),
+                        help="текущий список шардов через запятую (по умолчанию $SHARD_URLS)")
+    parser.add_argument("--to-urls", required=True, help="новый список шардов через запятую")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    database.create_schema()
+    moved = rebalance(args.from_urls.split(","), args.to_urls.split(","), batch_size=args.batch_size)
+    print(f"Moved {moved} orders")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import time
+import threading
+from functools import wraps
+
+from flask import request, make_response
+
+import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WaitTimeout(Exception):
+    pass
+
+
+class Group:
+    """
+    Одновременные вызовы do() с одинаковым ключом выполняют fn один раз,
+    остальные ждут и получают тот же результат (или то же исключение)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, timeout=None, retry_on=()):
+        """
+        timeout - сколько секунд можно ждать чужой вызов (None - сколько угодно), потом WaitTimeout.
+        retry_on - исключения чужого вызова, после которых fn вызывается заново
+        (например, чужой вызов не уложился в свой, более короткий дедлайн)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                call = self.calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self.calls[key] = _Call()
+
+            if leader:
+                try:
+                    call.result = fn()
+                    return call.result
+                except Exception as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self.lock:
+                        del self.calls[key]
+                    call.done.set()
+
+            metrics.inc(f"{self.name}.singleflight.coalesced")
+            if deadline is None:
+                call.done.wait()
+            elif not call.done.wait(max(0.0, deadline - time.monotonic())):
+                metrics.inc(f"{self.name}.singleflight.wait_timeout")
+                raise WaitTimeout()
+            if call.error is None:
+                return call.result
+            if not isinstance(call.error, retry_on):
+                raise call.error
+
+
+def coalesce(name, timeout=None, retry_on=()):
+    """
+    Декоратор для Flask-обработчика: одинаковые одновременные запросы (метод, путь, параметры,
+    Accept) обрабатываются один раз, каждый получает свою копию ответа.
+    timeout() - сколько секунд запрос может ждать чужую обработку, retry_on - см. Group.do
+    """
+    group = Group(name)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.method, request.path, tuple(sorted(request.args.items(multi=True))),
+                   request.headers.get("Accept"))
+            response = group.do(key, lambda: make_response(view(*args, **kwargs)),
+                                timeout=timeout() if timeout else None, retry_on=retry_on)
+            return response.get_data(), response.status, response.headers.copy()
+        return wrapper
+    return decorator
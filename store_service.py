@@ -5,13 +5,24 @@ from datetime import date
 import json
 
 from pydantic import BaseModel, ValidationError
-from flask import Flask, request, jsonify
+from flask import Flask, request
 import sqlalchemy as sa
 import requests
 
 import database
+import metrics
+import admission
+import service_client
+import wire
+import profiling
+import singleflight
+import cache
 
 app = Flask(__name__)
+metrics.init_app(app)
+admission.init_app(app, "store")
+wire.init_app(app)
+profiling.init_app(app, "store")
 ROOT_PATH = "/api/v1"
 ORDER_SERVICE_URL = os.environ.get("ORDER_SERVICE_URL", "localhost:8380")
 print(f"Order service url: {ORDER_SERVICE_URL} ($ORDER_SERVICE_URL)")
@@ -19,6 +30,23 @@ WAREHOUSE_SERVICE_URL = os.environ.get("WAREHOUSE_SERVICE_URL", "localhost:8280"
 print(f"Warehouse service url: {WAREHOUSE_SERVICE_URL} ($WAREHOUSE_SERVICE_URL)")
 WARRANTY_SERVICE_URL = os.environ.get("WARRANTY_SERVICE_URL", "localhost:8180")
 print(f"Warranty service url: {WARRANTY_SERVICE_URL} ($WARRANTY_SERVICE_URL)")
+STORE_REQUEST_BUDGET = float(os.environ.get("STORE_REQUEST_BUDGET", 5))
+print(f"Store request budget: {STORE_REQUEST_BUDGET} s ($STORE_REQUEST_BUDGET)")
+service_client.init_app(app, default_budget=STORE_REQUEST_BUDGET)
+STORE_STALE_SECONDS = float(os.environ.get("STORE_STALE_SECONDS", 0))
+print(f"Store stale-while-revalidate window: {STORE_STALE_SECONDS} s ($STORE_STALE_SECONDS, 0 - disabled)")
+STORE_FRESH_SECONDS = float(os.environ.get("STORE_FRESH_SECONDS", 5))
+print(f"Store fresh window: {STORE_FRESH_SECONDS} s ($STORE_FRESH_SECONDS)")
+STORE_STALE_ITEMS = int(os.environ.get("STORE_STALE_ITEMS", 10000))
+STORE_FETCH_TIMEOUT = float(os.environ.get("STORE_FETCH_TIMEOUT", 1))
+print(f"Store dependency fetch timeout with stale window: {STORE_FETCH_TIMEOUT} s ($STORE_FETCH_TIMEOUT)")
+STORE_REFRESH_WORKERS = int(os.environ.get("STORE_REFRESH_WORKERS", 4))
+print(f"Store background refresh workers: {STORE_REFRESH_WORKERS} ($STORE_REFRESH_WORKERS)")
+warehouse_items = cache.StaleWhileRevalidate("store.warehouse", STORE_STALE_ITEMS, STORE_FRESH_SECONDS,
+                                             STORE_STALE_SECONDS, workers=STORE_REFRESH_WORKERS)
+warranty_items = cache.StaleWhileRevalidate("store.warranty", STORE_STALE_ITEMS, STORE_FRESH_SECONDS,
+                                            STORE_STALE_SECONDS, workers=STORE_REFRESH_WORKERS)
+STALE_WARNING = '110 - "Response is Stale"'
 
 
 class User(database.Base):
@@ -38,18 +66,99 @@ class NewOrderRequest(BaseModel):
 
 
 def refresh_items_in_db():
+    """
+    Добавить стандартного пользователя, если его нет; остальные пользователи (например, из datagen) остаются
+    """
     with database.Session() as s:
-        s.execute(User.__table__.delete())
-        s.add_all([
-            User(id=1, name="Alex", user_uid="6d2cb5a0-943c-4b96-9aa6-89eac7bdfd2b"),
-        ])
+        if not s.query(User.id).filter(User.user_uid == "6d2cb5a0-943c-4b96-9aa6-89eac7bdfd2b").first():
+            s.add(User(name="Alex", user_uid="6d2cb5a0-943c-4b96-9aa6-89eac7bdfd2b"))
         print("Initialized default values in User table")
 
 
+user_exists_query = database.bakery(lambda s: s.query(User.id))
+user_exists_query += lambda q: q.filter(User.user_uid == sa.bindparam("user_uid"))
+
+
 def is_user_exists(user_uid):
-    with database.Session() as s:
-        user = s.query(User).filter(User.user_uid == user_uid).one_or_none()
-        return bool(user)
+    with database.Session(readonly=True) as s:
+        return user_exists_query(s).params(user_uid=user_uid).first() is not None
+
+
+class DependencyError(Exception):
+    pass
+
+
+def is_available(service_url, timeout=None):
+    try:
+        return service_client.get(f"http://{service_url}/manage/health", timeout=timeout).ok
+    except (requests.RequestException, service_client.DeadlineExceeded):
+        return False
+
+
+def _fetch_payload(url, failed_message, timeout=None):
+    response = service_client.get(url, timeout=timeout)
+    if not response.ok:
+        raise DependencyError(failed_message)
+    return service_client.payload(response)
+
+
+def _item_fetchers(items, service_url, url, unavailable_message, failed_message, health):
+    """
+    (fetch, revalidate) для items.get. fetch вызывается в запросе, когда сохраненного значения нет:
+    health-check сервиса (один на запрос, результат в health) и запрос данных, при включенном
+    stale-окне не дольше $STORE_FETCH_TIMEOUT; таймаут и исчерпанный бюджет - DependencyError.
+    revalidate идет в фоне прямо к сервису, без health-check
+    """
+    timeout = STORE_FETCH_TIMEOUT if items.enabled else None
+
+    def fetch():
+        if service_url not in health:
+            health[service_url] = is_available(service_url, timeout)
+        if not health[service_url]:
+            raise DependencyError(unavailable_message)
+        try:
+            return _fetch_payload(url, failed_message, timeout)
+        except (requests.RequestException, service_client.DeadlineExceeded):
+            raise DependencyError(unavailable_message)
+
+    def revalidate():
+        return _fetch_payload(url, failed_message)
+
+    return fetch, revalidate
+
+
+def get_item_details(item_uid, health=None):
+    """
+    Данные склада и гарантии по item_uid: (warehouse, warranty, stale).
+    Если сервис недоступен или медленный, в пределах $STORE_STALE_SECONDS отдаются
+    последние удачные данные (stale=True) и в фоне запрашиваются новые.
+    health - доступность сервисов, общая для всех item_uid одного запроса.
+    DependencyError - данных нет
+    """
+    health = {} if health is None else health
+    warehouse, warehouse_stale = warehouse_items.get(item_uid, *_item_fetchers(
+        warehouse_items, WAREHOUSE_SERVICE_URL, f"http://{WAREHOUSE_SERVICE_URL}{ROOT_PATH}/warehouse/{item_uid}",
+        "Warehouse sevice unavailable", "Order in warehouse not found", health
+    ))
+    warranty, warranty_stale = warranty_items.get(item_uid, *_item_fetchers(
+        warranty_items, WARRANTY_SERVICE_URL, f"http://{WARRANTY_SERVICE_URL}{ROOT_PATH}/warranty/{item_uid}",
+        "Warranty sevice unavailable", "Warranty not found", health
+    ))
+    return warehouse, warranty, warehouse_stale or warranty_stale
+
+
+def order_details_to_json(order, warehouse, warranty, stale):
+    result = {
+        "orderUid": order["orderUid"],
+        "date": order["orderDate"],
+        "model": warehouse["model"],
+        "size": warehouse["size"],
+        "warrantyDate": warranty["warrantyDate"],
+        "warrantyStatus": warranty["status"],
+    }
+    if stale:
+        result["stale"] = True
+    return result
 
 
 @app.route("/manage/health", methods=["GET"])
@@ -58,55 +167,36 @@ def health_check():
 
 
 @app.route(f"{ROOT_PATH}/store/<string:user_uid>/orders", methods=["GET"])
+@singleflight.coalesce("store", timeout=service_client.remaining, retry_on=service_client.DEADLINE_ERRORS)
 def request_all_orders(user_uid):
     """
-    Получить список заказов пользователя
+    Получить список заказов пользователя.
+    includeArchived=true - вместе с архивными заказами
     """
     user_uid = user_uid.lower()
     if not is_user_exists(user_uid):
         return {"message": "User not found"}, 404
 
-    if not requests.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
         return {"message": "Order sevice unavailable"}, 422
-    if not requests.get(f"http://{WAREHOUSE_SERVICE_URL}/manage/health").ok:
-        return {"message": "Warehouse sevice unavailable"}, 422
-    if not requests.get(f"http://{WARRANTY_SERVICE_URL}/manage/health").ok:
-        return {"message": "Warranty sevice unavailable"}, 422
 
-    order_service_response = requests.get(
-        f"http://{ORDER_SERVICE_URL}{ROOT_PATH}/orders/{user_uid}"
+    order_service_response = service_client.get(
+        f"http://{ORDER_SERVICE_URL}{ROOT_PATH}/orders/{user_uid}",
+        params={"includeArchived": "true"} if request.args.get("includeArchived") == "true" else None
     )
     if not order_service_response.ok:
         return {"message": "Order not found"}, 422
 
-    result = []
-
-    for order in order_service_response.json():
-        order_uid = order["orderUid"]
-        item_uid = order["itemUid"]
+    result, health = [], {}
+    for order in service_client.payload(order_service_response):
+        try:
+            details = get_item_details(order["itemUid"], health)
+        except DependencyError as e:
+            return {"message": str(e)}, 422
+        result.append(order_details_to_json(order, *details))
 
-        warehouse_service_response = requests.get(
-            f"http://{WAREHOUSE_SERVICE_URL}{ROOT_PATH}/warehouse/{item_uid}"
-        )
-        if not warehouse_service_response.ok:
-            return {"message": "Order in warehouse not found"}, 422
-
-        warranty_service_response = requests.get(
-            f"http://{WARRANTY_SERVICE_URL}{ROOT_PATH}/warranty/{item_uid}"
-        )
-        if not warranty_service_response.ok:
-            return {"message": "Warranty not found"}, 422
-
-        result.append({
-            "orderUid": order_uid,
-            "date": order["orderDate"],
-            "model": warehouse_service_response.json()["model"],
-            "size": warehouse_service_response.json()["size"],
-            "warrantyDate": warranty_service_response.json()["warrantyDate"],
-            "warrantyStatus": warranty_service_response.json()["status"],
-        })
-
-    return jsonify(result), 200
+    headers = {"Warning": STALE_WARNING} if any(order.get("stale") for order in result) else {}
+    return wire.jsonify(result), 200, headers
 
 
 @app.route(f"{ROOT_PATH}/store/<string:user_uid>/<string:order_uid>", methods=["GET"])
@@ -119,40 +209,22 @@ def request_order(user_uid, order_uid):
     if not is_user_exists(user_uid):
         return {"message": "User not found"}, 404
 
-    if not requests.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
         return {"message": "Order sevice unavailable"}, 422
-    if not requests.get(f"http://{WAREHOUSE_SERVICE_URL}/manage/health").ok:
-        return {"message": "Warehouse sevice unavailable"}, 422
-    if not requests.get(f"http://{WARRANTY_SERVICE_URL}/manage/health").ok:
-        return {"message": "Warranty sevice unavailable"}, 422
 
-    order_service_response = requests.get(
+    order_service_response = service_client.get(
         f"http://{ORDER_SERVICE_URL}{ROOT_PATH}/orders/{user_uid}/{order_uid}"
     )
     if not order_service_response.ok:
         return {"message": "Order not found"}, 422
-    item_uid = order_service_response.json()["itemUid"]
-
-    warehouse_service_response = requests.get(
-        f"http://{WAREHOUSE_SERVICE_URL}{ROOT_PATH}/warehouse/{item_uid}"
-    )
-    if not warehouse_service_response.ok:
-        return {"message": "Order in warehouse not found"}, 422
-
-    warranty_service_response = requests.get(
-        f"http://{WARRANTY_SERVICE_URL}{ROOT_PATH}/warranty/{item_uid}"
-    )
-    if not warranty_service_response.ok:
-        return {"message": "Warranty not found"}, 422
+    order = {**service_client.payload(order_service_response), "orderUid": order_uid}
 
-    return {
-               "orderUid": order_uid,
-               "date": order_service_response.json()["orderDate"],
-               "model": warehouse_service_response.json()["model"],
-               "size": warehouse_service_response.json()["size"],
-               "warrantyDate": warranty_service_response.json()["warrantyDate"],
-               "warrantyStatus": warranty_service_response.json()["status"],
-           }, 200
+    try:
+        warehouse, warranty, stale = get_item_details(order["itemUid"])
+    except DependencyError as e:
+        return {"message": str(e)}, 422
+    headers = {"Warning": STALE_WARNING} if stale else {}
+    return order_details_to_json(order, warehouse, warranty, stale), 200, headers
 
 
 @app.route(f"{ROOT_PATH}/store/<string:user_uid>/<string:order_uid>/warranty", methods=["POST"])
@@ -165,21 +237,21 @@ def request_warranty(user_uid, order_uid):
     if not is_user_exists(user_uid):
         return {"message": "User not found"}, 404
 
-    if not requests.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
         return {"message": "Order sevice unavailable"}, 422
 
     try:
-        warranty_request = WarrantyRequest.parse_obj(request.get_json(force=True))
+        warranty_request = WarrantyRequest.parse_obj(wire.get_payload())
     except ValidationError as e:
         return {"message": e.errors()}, 400
 
-    order_service_response = requests.post(
+    order_service_response = service_client.post(
         f"http://{ORDER_SERVICE_URL}{ROOT_PATH}/orders/{order_uid}/warranty",
         json={"reason": warranty_request.reason}
     )
     if not order_service_response.ok:
         return {"message": "Order not found"}, 422
-    return {"orderUid": order_uid, **order_service_response.json()}, 200
+    return {"orderUid": order_uid, **service_client.payload(order_service_response)}, 200
 
 
 @app.route(f"{ROOT_PATH}/store/<string:user_uid>/purchase", methods=["POST"])
@@ -191,22 +263,22 @@ def request_purchase(user_uid):
     if not is_user_exists(user_uid):
         return {"message": "User not found"}, 404
 
-    if not requests.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
         return {"message": "Order sevice unavailable"}, 422
 
     try:
-        new_order_request = NewOrderRequest.parse_obj(request.get_json(force=True))
+        new_order_request = NewOrderRequest.parse_obj(wire.get_payload())
     except ValidationError as e:
         return {"message": e.errors()}, 400
 
-    order_service_response = requests.post(
+    order_service_response = service_client.post(
         f"http://{ORDER_SERVICE_URL}{ROOT_PATH}/orders/{user_uid}",
         json={"model": new_order_request.model, "size": new_order_request.size}
     )
     if not order_service_response.ok:
         return {"message": "Order not created"}, 422
 
-    order_uid = order_service_response.json()["orderUid"]
+    order_uid = service_client.payload(order_service_response)["orderUid"]
     return '', 201, {"Location": f"{ROOT_PATH}/store/{user_uid}/{order_uid}"}
 
 
@@ -220,10 +292,10 @@ def request_refund(user_uid, order_uid):
     if not is_user_exists(user_uid):
         return {"message": "User not found"}, 404
 
-    if not requests.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{ORDER_SERVICE_URL}/manage/health").ok:
         return {"message": "Order sevice unavailable"}, 422
 
-    order_service_response = requests.delete(
+    order_service_response = service_client.delete(
         f"http://{ORDER_SERVICE_URL}{ROOT_PATH}/orders/{order_uid}"
     )
     if not order_service_response.ok:
@@ -0,0 +1,140 @@
+"""
+Микробенчмарки обработчиков сервисов.
+
+Запуск:                      RUN_BENCHMARKS=1 pytest tests/benchmarks
+Сохранить базовые значения:  RUN_BENCHMARKS=1 BENCHMARK_UPDATE=1 pytest tests/benchmarks
+Скорость считается относительно эталона, который вызывается вперемешку с замеряемым (health-check пустого
+Flask-приложения), поэтому сравнение не зависит от машины. Тест падает, если отношение
+упало больше чем на $BENCHMARK_THRESHOLD (по умолчанию 25%) относительно tests/benchmarks/baselines.json
+"""
+import os
+import json
+import time
+import tracemalloc
+
+import pytest
+from flask import Flask
+
+RUN_BENCHMARKS = os.environ.get("RUN_BENCHMARKS") == "1"
+BENCHMARK_UPDATE = os.environ.get("BENCHMARK_UPDATE") == "1"
+BENCHMARK_THRESHOLD = float(os.environ.get("BENCHMARK_THRESHOLD", 0.25))
+BENCHMARK_MIN_TIME = float(os.environ.get("BENCHMARK_MIN_TIME", 0.5))
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+_results = {}
+_sizes = {}
+
+
+def _load_baselines():
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH) as f:
+        return json.load(f)
+
+
+def _median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def measure(fn, setup=None, reference=None, min_time=BENCHMARK_MIN_TIME, min_rounds=20, alloc_rounds=10):
+    """
+    Вызывать fn, пока не наберется min_time секунд и min_rounds вызовов.
+    setup() вызывается перед каждым fn() и в замер не входит; reference() вызывается
+    после каждого fn(), чтобы эталон и fn замерялись в одинаковых условиях.
+    Возвращает (вызовов в секунду, скорость относительно reference по медианам времени вызова
+    или None, пиковый объем выделенной памяти на вызов в байтах)
+    """
+    setup = setup or (lambda: None)
+    setup()
+    fn()
+
+    times, reference_times = [], []
+    while len(times) < min_rounds or sum(times) < min_time:
+        setup()
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+        if reference is not None:
+            started = time.perf_counter()
+            reference()
+            reference_times.append(time.perf_counter() - started)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_rounds):
+            setup()
+            tracemalloc.clear_traces()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak)
+    finally:
+        tracemalloc.stop()
+    relative = _median(reference_times) / _median(times) if reference_times else None
+    return len(times) / sum(times), relative, _median(peaks)
+
+
+@pytest.fixture(scope="session")
+def reference():
+    """
+    Эталон: health-check пустого Flask-приложения
+    """
+    if not RUN_BENCHMARKS:
+        pytest.skip("set RUN_BENCHMARKS=1 to run benchmarks")
+    app = Flask("benchmark-reference")
+    app.add_url_rule("/manage/health", "health", lambda: ("UP", 200))
+    test_client = app.test_client()
+    return lambda: test_client.get("/manage/health")
+
+
+@pytest.fixture()
+def benchmark(request, reference):
+    """
+    benchmark(fn, setup=None) - замерить fn и сравнить отношение к эталону с сохраненным для этого теста
+    """
+    def run(fn, setup=None, name=None):
+        key = name or request.node.nodeid.split("/")[-1]
+        ops, relative, peak = measure(fn, setup, reference)
+        _results[key] = {"ops": round(ops, 1), "relative": round(relative, 4), "peak_bytes": peak}
+        baseline = _load_baselines().get(key)
+        if baseline and not BENCHMARK_UPDATE and relative < baseline["relative"] * (1 - BENCHMARK_THRESHOLD):
+            pytest.fail(f"{key}: {relative:.3f} of reference, baseline {baseline['relative']:.3f} "
+                        f"(threshold {BENCHMARK_THRESHOLD:.0%})")
+        return ops, peak
+
+    return run
+
+
+@pytest.fixture()
+def record_size(request):
+    """
+    record_size(label, size) - сохранить размер в байтах для итоговой таблицы benchmarks
+    """
+    if not RUN_BENCHMARKS:
+        pytest.skip("set RUN_BENCHMARKS=1 to run benchmarks")
+
+    def record(label, size):
+        _sizes[f"{request.node.nodeid.split('/')[-1]} {label}"] = size
+
+    return record
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results and not _sizes:
+        return
+    baselines = _load_baselines()
+    terminalreporter.section("benchmarks")
+    for key, size in sorted(_sizes.items()):
+        terminalreporter.write_line(f"{key:<75} {size:>10} B")
+    terminalreporter.write_line(f"{'name':<75} {'ops/s':>10} {'relative':>10} {'baseline':>10} {'KiB/call':>10}")
+    for key, result in sorted(_results.items()):
+        baseline = baselines.get(key, {}).get("relative", "-")
+        terminalreporter.write_line(
+            f"{key:<75} {result['ops']:>10.0f} {result['relative']:>10.3f} {baseline:>10} "
+            f"{result['peak_bytes'] / 1024:>10.1f}"
+        )
+    if BENCHMARK_UPDATE:
+        baselines.update(_results)
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        terminalreporter.write_line(f"baselines saved to {BASELINES_PATH}")
@@ -0,0 +1,63 @@
+import re
+from datetime import date
+from itertools import count
+
+import requests_mock
+
+from database import Session
+from order_service import app, Order
+
+
+def add_order(order_uid, user_uid="1"):
+    with Session() as s:
+        s.add(Order(item_uid="item-1", order_date=date.today(), order_uid=order_uid,
+                    status="PAID", user_uid=user_uid))
+
+
+def test_bench_health_check(benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/manage/health"))
+
+
+def test_bench_request_new_order(fresh_database, benchmark):
+    with app.test_client() as test_client, requests_mock.Mocker() as m:
+        m.get(re.compile("/manage/health"), text="UP")
+        m.post(re.compile("/api/v1/warehouse"),
+               json={"orderItemUid": "item-1", "orderUid": "1-1-1", "model": "Lego 8880", "size": "L"})
+        m.post(re.compile("/api/v1/warranty/item-1"), status_code=204)
+        benchmark(lambda: test_client.post("/api/v1/orders/1", json={"model": "Lego 8880", "size": "L"}))
+
+
+def test_bench_request_order(fresh_database, benchmark):
+    add_order("1-1-1")
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/api/v1/orders/1/1-1-1"))
+
+
+def test_bench_request_all_orders(fresh_database, benchmark):
+    for i in range(20):
+        add_order(f"1-1-{i}")
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/api/v1/orders/1"))
+
+
+def test_bench_request_warranty(fresh_database, benchmark):
+    add_order("1-1-1")
+    with app.test_client() as test_client, requests_mock.Mocker() as m:
+        m.get(re.compile("/manage/health"), text="UP")
+        m.post(re.compile("/api/v1/warehouse"), json={"warrantyDate": "2020-11-11", "decision": "FIXING"})
+        benchmark(lambda: test_client.post("/api/v1/orders/1-1-1/warranty", json={"reason": "Broken"}))
+
+
+def test_bench_request_delete_order(fresh_database, benchmark):
+    order_uids = count()
+    current = {}
+
+    def setup():
+        current["uid"] = f"1-1-{next(order_uids)}"
+        add_order(current["uid"])
+
+    with app.test_client() as test_client, requests_mock.Mocker() as m:
+        m.get(re.compile("/manage/health"), text="UP")
+        m.delete(re.compile("/api/v1/warehouse"), status_code=204)
+        benchmark(lambda: test_client.delete(f"/api/v1/orders/{current['uid']}"), setup=setup)
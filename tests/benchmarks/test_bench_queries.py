@@ -0,0 +1,58 @@
+"""
+Горячие запросы: полные ORM-сущности против колоночных запечённых запросов (baked)
+"""
+from datetime import date
+
+import pytest
+
+from database import Session
+from order_service import Order, user_orders_query
+from store_service import User, user_exists_query
+from warehouse_service import Item, OrderItem, refresh_items_in_db, item_info_query
+from warranty_service import Warranty, Status, warranty_status_query
+
+
+@pytest.fixture()
+def hot_data(fresh_database):
+    refresh_items_in_db()
+    with Session() as s:
+        s.add(User(id=1, name="Alex", user_uid="1"))
+        s.add(OrderItem(item_id=1, order_item_uid="item-1", order_uid="1-1-1"))
+        s.add(Warranty(item_uid="item-1", status=Status.on, warranty_date=date.today()))
+        s.add_all([
+            Order(item_uid=f"item-{i}", order_date=date.today(), order_uid=f"1-1-{i}", status="PAID", user_uid="1")
+            for i in range(20)
+        ])
+
+
+QUERIES = {
+    "warranty_status": {
+        "orm": lambda s: s.query(Warranty).filter(Warranty.item_uid == "item-1").one_or_none(),
+        "baked": lambda s: warranty_status_query(s).params(item_uid="item-1").one_or_none(),
+    },
+    "warehouse_get_info": {
+        "orm": lambda s: s.query(OrderItem, Item).join(Item)
+        .filter(OrderItem.order_item_uid == "item-1").one_or_none(),
+        "baked": lambda s: item_info_query(s).params(order_item_uid="item-1").one_or_none(),
+    },
+    "order_all_orders": {
+        "orm": lambda s: s.query(Order).filter(Order.user_uid == "1").all(),
+        "baked": lambda s: user_orders_query(s).params(user_uid="1").all(),
+    },
+    "store_is_user_exists": {
+        "orm": lambda s: s.query(User).filter(User.user_uid == "1").one_or_none(),
+        "baked": lambda s: user_exists_query(s).params(user_uid="1").first(),
+    },
+}
+
+
+@pytest.mark.parametrize("variant", ["orm", "baked"])
+@pytest.mark.parametrize("query", QUERIES)
+def test_bench_hot_query(hot_data, benchmark, query, variant):
+    run = QUERIES[query][variant]
+
+    def call():
+        with Session(readonly=True) as s:
+            assert run(s)
+
+    benchmark(call)
@@ -0,0 +1,57 @@
+import re
+
+import pytest
+import requests_mock
+
+from database import Session
+from store_service import app, User
+
+ORDER = {"itemUid": "item-1", "orderDate": "2020-11-22T00:00:00", "orderUid": "1-1-1", "status": "PAID"}
+WAREHOUSE_ITEM = {"model": "Lego 8880", "size": "L"}
+WARRANTY = {"itemUid": "item-1", "warrantyDate": "2020-11-22T00:00:00", "status": "ON_WARRANTY"}
+
+
+@pytest.fixture()
+def downstream(fresh_database):
+    with Session() as s:
+        s.add(User(id=1, name="Alex", user_uid="1"))
+    with requests_mock.Mocker() as m:
+        m.get(re.compile("/manage/health"), text="UP")
+        m.get(re.compile("/api/v1/orders/1$"), json=[ORDER] * 10)
+        m.get(re.compile("/api/v1/orders/1/1-1-1"), json=ORDER)
+        m.post(re.compile("/api/v1/orders/1$"), json={"orderUid": "1-1-1"})
+        m.post(re.compile("/api/v1/orders/1-1-1/warranty"), json={"warrantyDate": "2020-11-11", "decision": "FIXING"})
+        m.delete(re.compile("/api/v1/orders/1-1-1"), status_code=204)
+        m.get(re.compile("/api/v1/warehouse"), json=WAREHOUSE_ITEM)
+        m.get(re.compile("/api/v1/warranty"), json=WARRANTY)
+        yield m
+
+
+def test_bench_health_check(benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/manage/health"))
+
+
+def test_bench_request_all_orders(downstream, benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/api/v1/store/1/orders"))
+
+
+def test_bench_request_order(downstream, benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/api/v1/store/1/1-1-1"))
+
+
+def test_bench_request_warranty(downstream, benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.post("/api/v1/store/1/1-1-1/warranty", json={"reason": "Broken"}))
+
+
+def test_bench_request_purchase(downstream, benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.post("/api/v1/store/1/purchase", json={"model": "Lego 8880", "size": "L"}))
+
+
+def test_bench_request_refund(downstream, benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.delete("/api/v1/store/1/1-1-1/refund"))
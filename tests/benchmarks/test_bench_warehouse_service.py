@@ -0,0 +1,55 @@
+import re
+from itertools import count
+
+import requests_mock
+
+from database import Session
+from warehouse_service import app, refresh_items_in_db, OrderItem
+
+NEW_ITEM = {"orderUid": "1-1-1", "model": "Lego 8880", "size": "L"}
+
+
+def add_order_item(order_item_uid):
+    with Session() as s:
+        s.add(OrderItem(item_id=1, order_item_uid=order_item_uid, order_uid="1-1-1"))
+
+
+def test_bench_health_check(benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/manage/health"))
+
+
+def test_bench_request_get_info(fresh_database, benchmark):
+    refresh_items_in_db()
+    add_order_item("item-1")
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/api/v1/warehouse/item-1"))
+
+
+def test_bench_request_new_item(fresh_database, benchmark):
+    refresh_items_in_db()
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.post("/api/v1/warehouse", json=NEW_ITEM))
+
+
+def test_bench_request_warranty(fresh_database, benchmark):
+    refresh_items_in_db()
+    add_order_item("item-1")
+    with app.test_client() as test_client, requests_mock.Mocker() as m:
+        m.get(re.compile("/manage/health"), text="UP")
+        m.post(re.compile("/api/v1/warranty/item-1/warranty"),
+               json={"warrantyDate": "2020-11-11", "decision": "FIXING"})
+        benchmark(lambda: test_client.post("/api/v1/warehouse/item-1/warranty", json={"reason": "Broken"}))
+
+
+def test_bench_request_remove_item(fresh_database, benchmark):
+    refresh_items_in_db()
+    item_uids = count()
+    current = {}
+
+    def setup():
+        current["uid"] = f"item-{next(item_uids)}"
+        add_order_item(current["uid"])
+
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.delete(f"/api/v1/warehouse/{current['uid']}"), setup=setup)
@@ -0,0 +1,40 @@
+from datetime import date
+from itertools import count
+
+from database import Session
+from warranty_service import app, Warranty, Status
+
+
+def add_warranty(item_uid):
+    with Session() as s:
+        s.add(Warranty(item_uid=item_uid, status=Status.on, warranty_date=date.today()))
+
+
+def test_bench_health_check(benchmark):
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/manage/health"))
+
+
+def test_bench_request_warranty_status(fresh_database, benchmark):
+    add_warranty("1-1-1")
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.get("/api/v1/warranty/1-1-1"))
+
+
+def test_bench_request_warranty_result(fresh_database, benchmark):
+    add_warranty("1-1-1")
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.post("/api/v1/warranty/1-1-1/warranty",
+                                           json={"reason": "Broken", "availableCount": 1}))
+
+
+def test_bench_request_start_warranty(fresh_database, benchmark):
+    item_uids = count()
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.post(f"/api/v1/warranty/item-{next(item_uids)}"))
+
+
+def test_bench_request_stop_warranty(fresh_database, benchmark):
+    add_warranty("1-1-1")
+    with app.test_client() as test_client:
+        benchmark(lambda: test_client.delete("/api/v1/warranty/1-1-1"))
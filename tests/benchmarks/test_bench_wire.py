@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+
+ORDERS = [{
+    "orderUid": f"6d2cb5a0-943c-4b96-9aa6-89eac7bd{i:04d}",
+    "orderDate": "2020-11-22T00:00:00",
+    "itemUid": f"3fa85f64-5717-4562-b3fc-2c963f66{i:04d}",
+    "status": "PAID",
+} for i in range(100)]
+CHANGES = {
+    "changes": [{"seq": i, "uid": f"3fa85f64-5717-4562-b3fc-2c963f66{i:04d}", "kind": "status",
+                 "status": "ON_WARRANTY", "createdAt": "2020-11-22T00:00:00"} for i in range(1000)],
+    "lastSeq": 999,
+}
+PAYLOADS = {"orders": ORDERS, "changes": CHANGES}
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_bench_payload_size(record_size, payload):
+    json_size = len(json.dumps(PAYLOADS[payload]).encode())
+    msgpack_size = len(msgpack.packb(PAYLOADS[payload], use_bin_type=True))
+    record_size("json", json_size)
+    record_size("msgpack", msgpack_size)
+    assert msgpack_size < json_size
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+@pytest.mark.parametrize("codec", ["json", "msgpack"])
+def test_bench_encode_decode(benchmark, payload, codec):
+    data = PAYLOADS[payload]
+    if codec == "json":
+        benchmark(lambda: json.loads(json.dumps(data)))
+    else:
+        benchmark(lambda: msgpack.unpackb(msgpack.packb(data, use_bin_type=True), raw=False))
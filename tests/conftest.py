@@ -3,13 +3,16 @@ from unittest.mock import patch
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from database import create_schema, Session
 
 
 @pytest.fixture()
 def fresh_database():
-    engine = create_engine("sqlite:///:memory:")
+    # одно соединение на все потоки, иначе фоновые потоки видят пустую базу
+    engine = create_engine("sqlite:///:memory:", poolclass=StaticPool,
+                           connect_args={"check_same_thread": False})
     with patch.object(Session, "__init__", return_value=None), \
             patch.object(Session, "session_class", side_effect=sessionmaker(bind=engine)),\
             patch("database.engine", return_value=engine):
@@ -0,0 +1,68 @@
+import time
+import threading
+from unittest.mock import patch
+
+from flask import Flask
+
+import admission
+import metrics
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.001)
+
+
+def test_admission_queue_and_rejection():
+    controller = admission.AdmissionController("test-queue", limit=1, min_limit=1, queue_size=1,
+                                               queue_timeout=1.0)
+    assert controller.acquire()
+
+    queued = []
+    waiter = threading.Thread(target=lambda: queued.append(controller.acquire()))
+    waiter.start()
+    wait_until(lambda: controller.waiting > 0)
+    assert not controller.acquire()
+
+    controller.release(0.01)
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert queued == [True]
+    assert metrics.snapshot()["test-queue.admission.rejected"] == 1
+
+
+def test_admission_adapts_limit():
+    controller = admission.AdmissionController("test-adapt", limit=10, min_limit=2, target_latency=0.1)
+    for _ in range(10):
+        controller.acquire()
+    for _ in range(10):
+        controller.release(1.0)
+    assert controller.limit == 9
+
+    now = time.monotonic()
+    for i in range(10):
+        with patch("admission.time.monotonic", return_value=now + i):
+            controller.acquire()
+            controller.release(1.0)
+    assert controller.limit < 5
+    for _ in range(50):
+        controller.acquire()
+        controller.release(0.01)
+    assert controller.limit > 5
+
+
+def test_admission_returns_503():
+    app = Flask(__name__)
+    app.add_url_rule("/work", "work", lambda: ("done", 200))
+    app.add_url_rule("/manage/health", "health", lambda: ("UP", 200))
+    controller = admission.init_app(app, "test-app", limit=1, queue_size=0)
+    controller.acquire()
+    with app.test_client() as test_client:
+        response = test_client.get("/work")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert test_client.get("/manage/health").status_code == 200
+        controller.release(0.0)
+        assert test_client.get("/work").status_code == 200
@@ -0,0 +1,49 @@
+from unittest.mock import patch
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+import database
+from order_service import order_changes
+
+
+def shard_engines(tmp_path, count):
+    engines = [sa.create_engine(f"sqlite:///{tmp_path / f'shard-{i}.db'}") for i in range(count)]
+    for engine in engines:
+        database.Base.metadata.create_all(engine)
+    return engines
+
+
+def record(engine, *changes):
+    s = sessionmaker(bind=engine)()
+    order_changes.record_many(s, list(changes))
+    s.commit()
+
+
+def test_counter_continues_existing_feed(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'data.db'}")
+    order_changes.table.create(engine)
+    engine.execute(order_changes.table.insert(), [{"seq": 7, "entity_uid": "old", "kind": "created"}])
+    order_changes.counter.create(engine)
+
+    record(engine, ("order-1", "created", "PAID"), ("order-2", "created", "PAID"))
+    assert [seq for seq, in engine.execute(sa.select([order_changes.table.c.seq]))] == [7, 8, 9]
+
+
+def test_sharded_cursor(tmp_path):
+    engines = shard_engines(tmp_path, 2)
+    record(engines[0], ("order-1", "created", "PAID"))
+    record(engines[1], ("order-2", "created", "PAID"))
+    record(engines[0], ("order-1", "deleted", None))
+
+    with patch("database.shard_engines", engines):
+        assert order_changes.parse_cursor("0") == [0, 0]
+        changes, cursor = order_changes.read([0, 0], limit=10)
+        assert [(c["entity_uid"], c["kind"]) for c in changes] == [
+            ("order-1", "created"), ("order-2", "created"), ("order-1", "deleted"),
+        ]
+        assert order_changes.format_cursor(cursor) == "2,1"
+
+        changes, cursor = order_changes.read(order_changes.parse_cursor("1,0"), limit=1)
+        assert [(c["entity_uid"], c["shard"]) for c in changes] == [("order-2", 1)]
+        assert cursor == [1, 1]
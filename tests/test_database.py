@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from unittest.mock import patch
+
+import sqlalchemy as sa
+
+import database
+
+
+def test_replica_round_robin_and_failover(tmp_path):
+    broken = sa.create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    replica = sa.create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    with patch("database.replica_engines", [broken, replica]), \
+            patch.object(database._ReplicaState, "last_writes", {}), \
+            patch.object(database._ReplicaState, "down_until", {}):
+        for _ in range(3):
+            connection = database.replica_connection()
+            assert connection.engine is replica
+            connection.close()
+        assert broken in database._ReplicaState.down_until
+
+        session = database.Session(readonly=True)
+        assert session.connection.engine is replica
+        with session as s:
+            assert s.execute("select 1").scalar() == 1
+        assert session.connection is None
+
+
+def test_read_your_writes_is_per_client(tmp_path):
+    replica = sa.create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    primary = sa.create_engine("sqlite:///:memory:")
+    database.Base.metadata.create_all(primary)
+    users = database.Base.metadata.tables["users"]
+    with patch("database.replica_engines", [replica]), \
+            patch.object(database._ReplicaState, "last_writes", OrderedDict()), \
+            patch("database.engine", primary):
+        database.set_client("reader")
+        with database.Session() as s:
+            s.execute(sa.select([users.c.id]))
+        assert database.replica_connection() is not None
+
+        database.set_client("writer")
+        with database.Session() as s:
+            s.execute(users.insert().values(name="writer", user_uid="writer"))
+        assert database.replica_connection() is None
+
+        database.set_client("reader")
+        assert database.replica_connection() is not None
+        database.set_client(None)
+
+
+def test_default_shard_reads_from_replica(tmp_path):
+    replica = sa.create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    with patch("database.replica_engines", [replica]), \
+            patch.object(database._ReplicaState, "last_writes", OrderedDict()), \
+            patch("database.shard_engines", [database.engine]):
+        session = database.Session(0, readonly=True)
+        assert session.connection.engine is replica
+        session.connection.close()
+
+    with patch("database.replica_engines", [replica]), \
+            patch("database.shard_engines", [sa.create_engine("sqlite:///:memory:")]):
+        assert database.Session(0, readonly=True).connection is None
@@ -0,0 +1,68 @@
+from collections import Counter
+from unittest.mock import MagicMock, patch
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+import database
+import store_service
+import warehouse_service
+from datagen import advance_sequence, generate, prepare_engine
+from order_service import Order
+from store_service import User
+from warehouse_service import Item, OrderItem
+from warranty_service import Warranty
+
+
+def test_generate(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'data.db'}")
+    shard = sa.create_engine(f"sqlite:///{tmp_path / 'shard.db'}")
+    prepare_engine(engine)
+    prepare_engine(shard)
+
+    generate(orders=500, users=50, items=10, store_engine=engine, order_engines=[engine, shard],
+             warehouse_engine=engine, warranty_engine=engine, batch_size=128)
+
+    assert engine.execute(sa.select([sa.func.count()]).select_from(User.__table__)).scalar() == 50
+    assert engine.execute(sa.select([sa.func.count()]).select_from(OrderItem.__table__)).scalar() == 500
+    assert engine.execute(sa.select([sa.func.count()]).select_from(Warranty.__table__)).scalar() == 500
+
+    orders = []
+    for number, e in enumerate((engine, shard)):
+        rows = e.execute(sa.select([Order.__table__.c.order_uid, Order.__table__.c.user_uid,
+                                    Order.__table__.c.item_uid])).fetchall()
+        assert all(database.shard_for(user_uid, 2) == number for _, user_uid, _ in rows)
+        assert all(int(order_uid[:4], 16) == number for order_uid, _, _ in rows)
+        orders += [(user_uid, item_uid) for _, user_uid, item_uid in rows]
+
+    item_uids = {uid for uid, in engine.execute(sa.select([OrderItem.__table__.c.order_item_uid]))}
+    assert all(item_uid in item_uids for _, item_uid in orders)
+
+    top_users = Counter(user_uid for user_uid, _ in orders).most_common(10)
+    assert sum(count for _, count in top_users) > len(orders) * 0.5
+
+
+def test_service_startup_keeps_generated_data(fresh_database, tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'data.db'}")
+    prepare_engine(engine)
+    generate(orders=50, users=5, items=10, store_engine=engine, order_engines=[engine],
+             warehouse_engine=engine, warranty_engine=engine)
+
+    with patch.object(database.Session, "session_class", side_effect=sessionmaker(bind=engine)):
+        store_service.refresh_items_in_db()
+        warehouse_service.refresh_items_in_db()
+        warehouse_service.refresh_items_in_db()
+
+    def count(table):
+        return engine.execute(sa.select([sa.func.count()]).select_from(table)).scalar()
+    assert count(User.__table__) == 6
+    assert count(Item.__table__) == 13
+    assert count(OrderItem.__table__) == 50
+
+
+def test_advance_sequence_on_postgres():
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    advance_sequence(engine, User.__table__)
+    assert str(engine.execute.call_args[0][0]) == \
+        "SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT coalesce(max(id), 1) FROM users))"
@@ -0,0 +1,82 @@
+import pytest
+import requests
+
+import loadtest
+import monolith
+import store_service
+import warehouse_service
+
+COLLECTION = "postman_tests/postman-collection.json"
+ENVIRONMENT = "postman_tests/postman-local-environment.json"
+
+
+def test_collection_is_parsed():
+    steps = {step.name: step for step in loadtest.load_collection(COLLECTION)}
+    assert len(steps) == 22
+
+    start_warranty = steps["[warranty] Start warranty"]
+    assert start_warranty.method == "POST"
+    assert start_warranty.uuid_variables == ["itemUid"]
+    assert start_warranty.expected_status == 204
+
+    take_item = steps["[warehouse] Take item from Warehouse"]
+    assert [(e.variable, e.field) for e in take_item.extractors] == [("orderItemUid", "orderItemUid")]
+
+    purchase = steps["[store] Purchase item"]
+    assert [(e.variable, e.header, e.last_segment) for e in purchase.extractors] == [("orderUid", "Location", True)]
+
+
+def test_folder_filter():
+    steps = loadtest.load_collection(COLLECTION, ["Store service"])
+    assert [step.name for step in steps][:2] == ["[store] Health Check", "[store] Purchase item"]
+    assert len(steps) == 6
+
+
+def test_substitute_keeps_unknown_variables():
+    assert loadtest.substitute("{{a}}/{{b}}", {"a": "x"}) == "x/{{b}}"
+
+
+def test_stages_ramp_linearly():
+    stages = loadtest.parse_stages("10s:10,500ms:10,1m:0")
+    assert stages == [(10, 10), (0.5, 10), (60, 0)]
+    assert loadtest.target_users(stages, 0) == 0
+    assert loadtest.target_users(stages, 5) == 5
+    assert loadtest.target_users(stages, 10.2) == 10
+    assert loadtest.target_users(stages, 40.5) == 5
+    assert loadtest.target_users(stages, 100) == 0
+    with pytest.raises(ValueError):
+        loadtest.parse_duration("10h")
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert loadtest.percentile(values, 50) == 50
+    assert loadtest.percentile(values, 99) == 99
+    assert loadtest.percentile([], 50) == 0.0
+
+
+def test_store_flow_in_process(fresh_database):
+    store_service.refresh_items_in_db()
+    warehouse_service.refresh_items_in_db()
+    environment = loadtest.load_environment(ENVIRONMENT)
+    environment["storeUrl"] = "http://store.test"
+
+    def session_factory():
+        session = requests.Session()
+        session.mount("http://store.test/", monolith.InProcessAdapter(monolith.dispatch))
+        return session
+
+    monolith.install_transport()
+    try:
+        run = loadtest.LoadRun(
+            loadtest.load_collection(COLLECTION, ["Store service"]), environment,
+            loadtest.parse_stages("50ms:1,300ms:1"), session_factory=session_factory, tick=0.01
+        ).run()
+    finally:
+        monolith.uninstall_transport()
+
+    summary = run.summary()
+    assert run.iterations >= 1
+    assert all(row["errors"] == 0 for row in summary.values()), summary
+    assert summary["[store] Purchase item"]["statuses"] == {"201": summary["[store] Purchase item"]["count"]}
+    assert "[store] Return order" in run.report()
@@ -0,0 +1,41 @@
+import pytest
+from werkzeug.test import Client
+
+import monolith
+from database import Session
+from store_service import User
+from warehouse_service import refresh_items_in_db
+
+
+@pytest.fixture()
+def monolith_client(fresh_database):
+    refresh_items_in_db()
+    with Session() as s:
+        s.add(User(id=1, name="Alex", user_uid="1"))
+    monolith.install_transport()
+    yield Client(monolith.dispatch)
+    monolith.uninstall_transport()
+
+
+def test_purchase_flow_in_process(monolith_client):
+    response = monolith_client.post("/api/v1/store/1/purchase", json={"model": "Lego 8880", "size": "L"})
+    assert response.status_code == 201
+    order_uid = response.headers["Location"].rsplit("/", 1)[-1]
+
+    response = monolith_client.get(f"/api/v1/store/1/{order_uid}")
+    assert response.status_code == 200
+    assert response.json["model"] == "Lego 8880"
+    assert response.json["warrantyStatus"] == "ON_WARRANTY"
+
+    response = monolith_client.post(f"/api/v1/store/1/{order_uid}/warranty", json={"reason": "Broken"})
+    assert response.status_code == 200
+    assert response.json["decision"] == "RETURN"
+
+    response = monolith_client.delete(f"/api/v1/store/1/{order_uid}/refund")
+    assert response.status_code == 204
+    assert monolith_client.get("/api/v1/store/1/orders").json == []
+
+
+def test_internal_routes_are_mounted(monolith_client):
+    assert monolith_client.get("/api/v1/warehouse/unknown").status_code == 404
+    assert monolith_client.get("/manage/health").status_code == 200
@@ -1,12 +1,20 @@
+import database
 from database import Session
-from order_service import Order
-from datetime import date
+from order_service import Order, OrderLocation, archive_orders, find_order_shard, order_uid_shard
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
 import re
 
+import requests
 import requests_mock
 import pytest
 
-from order_service import app
+from order_service import app, order_cache, order_changes
+
+
+@pytest.fixture(autouse=True)
+def clear_order_cache():
+    order_cache.clear()
 
 
 @pytest.fixture()
@@ -46,6 +54,9 @@ def test_request_new_order(fresh_database):
         )
         assert order
         assert order.order_uid == response.json["orderUid"]
+        assert s.query(OrderLocation).count() == 0
+    assert order_uid_shard(response.json["orderUid"]) == 0
+    assert find_order_shard(response.json["orderUid"]) == 0
 
 
 def test_request_order(fresh_database, add_some_order):
@@ -87,3 +98,92 @@ def test_request_delete_order(fresh_database, add_some_order):
             m.delete(re.compile("/api/v1/warehouse"))
             response = test_client.delete("/api/v1/orders/1-1-1")
             assert response.status == "204 NO CONTENT"
+            assert response.headers["Server-Timing"].startswith("db-hold;dur=")
+    with Session() as s:
+        assert s.query(Order).count() == 0
+    changes, cursor = order_changes.read([0], limit=10)
+    assert [(c["entity_uid"], c["kind"], c["status"]) for c in changes] == [
+        ("1-1-1", "status", "WAITING"), ("1-1-1", "deleted", None),
+    ]
+    assert cursor == [2]
+
+
+def test_request_delete_order_compensation(fresh_database, add_some_order):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker(real_http=True) as m:
+            m.get(re.compile("/manage/health"), text='')
+            m.delete(re.compile("/api/v1/warehouse"), status_code=404)
+            response = test_client.delete("/api/v1/orders/1-1-1")
+            assert response.status_code == 422
+    with Session() as s:
+        assert s.query(Order).one().status == "PAID"
+
+
+def test_request_delete_order_timeout_keeps_lease(fresh_database, add_some_order):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker(real_http=True) as m:
+            m.get(re.compile("/manage/health"), text='')
+            m.delete(re.compile("/api/v1/warehouse"), exc=requests.Timeout)
+            assert test_client.delete("/api/v1/orders/1-1-1").status_code == 504
+            with Session() as s:
+                order = s.query(Order).one()
+                assert order.status == "WAITING"
+                assert order.waiting_until > datetime.now()
+
+            m.delete(re.compile("/api/v1/warehouse"))
+            assert test_client.delete("/api/v1/orders/1-1-1").status_code == 409
+
+
+def test_request_delete_order_takes_over_expired_lease(fresh_database, add_some_order):
+    with Session() as s:
+        order = s.query(Order).one()
+        order.status = "WAITING"
+        order.waiting_until = datetime.now() - timedelta(seconds=1)
+    with app.test_client() as test_client:
+        with requests_mock.Mocker(real_http=True) as m:
+            m.get(re.compile("/manage/health"), text='')
+            m.delete(re.compile("/api/v1/warehouse"), status_code=404)
+            assert test_client.delete("/api/v1/orders/1-1-1").status_code == 422
+            with Session() as s:
+                assert s.query(Order).one().status == "PAID"
+
+            m.delete(re.compile("/api/v1/warehouse"))
+            assert test_client.delete("/api/v1/orders/1-1-1").status_code == 204
+    with Session() as s:
+        assert s.query(Order).count() == 0
+
+
+def test_request_archived_order(fresh_database, add_some_order):
+    assert archive_orders(datetime.now() + timedelta(days=1), batch_size=1) == 1
+    with Session() as s:
+        assert s.query(Order).count() == 0
+
+    with app.test_client() as test_client:
+        response = test_client.get("/api/v1/orders/1/1-1-1")
+        assert response.status_code == 200
+        assert response.json["itemUid"] == 'item-1'
+
+        assert test_client.get("/api/v1/orders/1").json == []
+        response = test_client.get("/api/v1/orders/1?includeArchived=true")
+        assert response.json[0]["orderUid"] == '1-1-1'
+
+
+def test_replica_reads_are_not_cached(fresh_database, add_some_order):
+    with app.test_client() as test_client, patch.object(database.Session, "from_replica", True):
+        assert test_client.get("/api/v1/orders/1/1-1-1").json["orderUid"] == "1-1-1"
+    assert order_cache.get("1-1-1") is None
+
+
+def test_order_cache(fresh_database, add_some_order):
+    with app.test_client() as test_client:
+        hits = order_cache.hits
+        assert test_client.get("/api/v1/orders/1/1-1-1").status_code == 200
+        assert test_client.get("/api/v1/orders/1/1-1-1").status_code == 200
+        assert order_cache.hits == hits + 1
+        assert test_client.get("/api/v1/orders/2/1-1-1").status_code == 404
+
+        with requests_mock.Mocker(real_http=True) as m:
+            m.get(re.compile("/manage/health"), text='')
+            m.delete(re.compile("/api/v1/warehouse"))
+            assert test_client.delete("/api/v1/orders/1-1-1").status_code == 204
+        assert test_client.get("/api/v1/orders/1/1-1-1").status_code == 404
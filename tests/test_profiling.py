@@ -0,0 +1,73 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+import profiling
+from warranty_service import app
+
+HEADERS = {"X-Admin-Token": "secret"}
+
+
+def test_profile_inline(fresh_database):
+    with patch("admin.ADMIN_TOKEN", "secret"), app.test_client() as test_client:
+        response = test_client.get("/api/v1/warranty/1-1-1", headers={"X-Profile": "inline", **HEADERS})
+        assert response.status_code == 200
+        assert response.headers["X-Profiled-Status"].startswith("404")
+        assert "cumulative" in response.data.decode()
+
+        response = test_client.get("/api/v1/warranty/1-1-1", headers={"X-Profile": "inline"})
+        assert response.status_code == 404
+        assert "X-Profiled-Status" not in response.headers
+
+
+def test_profile_to_file(fresh_database, tmp_path):
+    with patch("admin.ADMIN_TOKEN", "secret"), patch("profiling.PROFILE_DIR", str(tmp_path)), \
+            app.test_client() as test_client:
+        response = test_client.get("/manage/health", headers={"X-Profile": "1", **HEADERS})
+        assert response.status_code == 200
+        assert response.data == b"UP"
+        assert response.headers["X-Profile-File"].startswith(str(tmp_path))
+        assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_profiled_request_runs_once_when_app_raises():
+    calls = []
+
+    def failing_app(environ, start_response):
+        calls.append(environ["PATH_INFO"])
+        raise ValueError("app error")
+
+    middleware = profiling.ProfilingMiddleware(failing_app, "test")
+    with patch("admin.ADMIN_TOKEN", "secret"), pytest.raises(ValueError):
+        middleware({"PATH_INFO": "/orders", "HTTP_X_PROFILE": "inline", "HTTP_X_ADMIN_TOKEN": "secret"},
+                   lambda status, headers: None)
+    assert calls == ["/orders"]
+
+
+def test_sampler_collapsed_stacks():
+    sampler = profiling.Sampler(interval=0.001)
+    sampled = threading.Event()
+
+    def handle_request():
+        sampler.enter()
+        sampled.wait()
+        sampler.exit()
+
+    thread = threading.Thread(target=handle_request)
+    thread.start()
+    while not sampler.active:
+        pass
+    sampler.sample()
+    sampled.set()
+    thread.join()
+
+    stacks = sampler.collapsed(reset=True)
+    assert "test_profiling.py:handle_request" in stacks
+    assert stacks.strip().endswith(" 1")
+    assert sampler.collapsed() == ""
+
+
+def test_manage_profile_requires_admin():
+    with app.test_client() as test_client:
+        assert test_client.get("/manage/profile").status_code == 403
@@ -0,0 +1,87 @@
+import re
+from unittest.mock import patch
+
+import pytest
+import requests
+import requests_mock
+
+import database
+import service_client
+from store_service import app, User, STORE_REQUEST_BUDGET
+from warehouse_service import app as warehouse_app
+from database import Session
+
+
+def test_budget_propagated_to_downstream(fresh_database):
+    with Session() as s:
+        s.add(User(id=1, name='Alex', user_uid='1'))
+    with app.test_client() as test_client:
+        with requests_mock.Mocker(real_http=True) as m:
+            m.get(re.compile("/manage/health"), text='')
+            m.post(re.compile("/api/v1/orders/1"), json={"orderUid": "1-1-1"})
+            response = test_client.post("/api/v1/store/1/purchase", json={"size": "L", "model": "item 1"},
+                                        headers={"X-Request-Budget-Ms": "3000"})
+            assert response.status_code == 201
+            budgets = [int(r.headers["X-Request-Budget-Ms"]) for r in m.request_history]
+            assert all(0 < budget <= 3000 for budget in budgets)
+            assert budgets == sorted(budgets, reverse=True)
+            assert {r.headers["X-Client-Id"] for r in m.request_history} == {"1"}
+
+
+def test_spent_budget_fails_fast(fresh_database):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            response = test_client.get("/api/v1/store/1/orders", headers={"X-Request-Budget-Ms": "0"})
+            assert response.status_code == 504
+            assert not m.request_history
+
+
+def test_downstream_timeout_returns_504(fresh_database):
+    with Session() as s:
+        s.add(User(id=1, name='Alex', user_uid='1'))
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            m.get(re.compile("/manage/health"), exc=requests.ReadTimeout)
+            response = test_client.get("/api/v1/store/1/orders")
+            assert response.status_code == 504
+
+
+def test_client_budget_is_capped_by_default(fresh_database):
+    with Session() as s:
+        s.add(User(id=1, name='Alex', user_uid='1'))
+    with app.test_client() as test_client:
+        for budget in ["999999999", "abc"]:
+            with requests_mock.Mocker() as m:
+                m.get(re.compile("/manage/health"), text='')
+                m.post(re.compile("/api/v1/orders/1"), json={"orderUid": "1-1-1"})
+                response = test_client.post("/api/v1/store/1/purchase", json={"size": "L", "model": "item 1"},
+                                            headers={"X-Request-Budget-Ms": budget})
+                assert response.status_code == 201
+                budgets = [int(r.headers["X-Request-Budget-Ms"]) for r in m.request_history]
+                assert all(0 < budget <= STORE_REQUEST_BUDGET * 1000 for budget in budgets)
+
+
+def test_spent_budget_skips_database_work(fresh_database):
+    with warehouse_app.test_request_context(), patch("service_client.remaining", return_value=-1):
+        with pytest.raises(service_client.DeadlineExceeded):
+            service_client.check_deadline()
+    with warehouse_app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            m.get(re.compile("/manage/health"), text='')
+            # бюджет кончается, пока идет health-check склада
+            with patch("service_client.remaining", side_effect=lambda: -1 if m.called else None), \
+                    patch("database.Session.session_class") as session_class:
+                response = test_client.post("/api/v1/warehouse/item-1/warranty", json={"reason": "Broken"})
+            assert response.status_code == 504
+            assert m.call_count == 1
+            assert not session_class.called
+
+
+def test_nested_request_restores_client(fresh_database):
+    with app.test_request_context("/api/v1/store/alice/orders"):
+        app.preprocess_request()
+        assert database.current_client() == "alice"
+        with warehouse_app.test_client() as test_client:
+            assert test_client.get("/manage/health", headers={"X-Client-Id": "bob"}).status_code == 200
+        assert database.current_client() == "alice"
+    assert database.current_client() is None
@@ -0,0 +1,75 @@
+from datetime import date
+from unittest.mock import patch
+
+import sqlalchemy as sa
+
+import archive
+import database
+from database import Session
+from order_service import Order, OrderArchive, OrderLocation, new_order_uid
+from shard_rebalance import rebalance
+
+
+def test_shard_for_is_stable():
+    assert database.shard_for("6d2cb5a0-943c-4b96-9aa6-89eac7bdfd2b", 4) == \
+        database.shard_for("6d2cb5a0-943c-4b96-9aa6-89eac7bdfd2b", 4)
+    assert {database.shard_for(str(i), 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_rebalance(fresh_database, tmp_path):
+    old_url = f"sqlite:///{tmp_path / 'shard-0.db'}"
+    new_urls = [old_url, f"sqlite:///{tmp_path / 'shard-1.db'}"]
+    old_engine = sa.create_engine(old_url)
+    database.Base.metadata.create_all(old_engine)
+    old_engine.execute(Order.__table__.insert(), [
+        {"item_uid": f"item-{i}", "order_date": date.today(), "order_uid": f"order-{i}",
+         "status": "PAID", "user_uid": f"user-{i}"}
+        for i in range(20)
+    ])
+    old_engine.execute(OrderArchive.insert(), [
+        {"id": i, "item_uid": f"item-{i}", "order_date": date(2000, 1, 1), "order_uid": f"archived-{i}",
+         "status": "PAID", "user_uid": f"user-{i}"}
+        for i in range(20, 30)
+    ])
+    old_engine.execute(Order.__table__.insert(), [
+        {"item_uid": f"item-{i}", "order_date": date(2000, 1, 1), "order_uid": f"ndjson-{i}",
+         "status": "PAID", "user_uid": f"user-{i}"}
+        for i in range(30, 40)
+    ])
+    with patch("archive.ARCHIVE_DIR", str(tmp_path / "archive")):
+        with patch.object(database.Session, "session_class", side_effect=sa.orm.sessionmaker(bind=old_engine)):
+            assert archive.archive_rows(Order.__table__, OrderArchive, Order.order_uid.like("ndjson-%"),
+                                        target="ndjson") == 10
+        moved = rebalance([old_url], new_urls, batch_size=7)
+    assert 0 < moved < 30
+
+    for shard, url in enumerate(new_urls):
+        user_uids = [uid for uid, in sa.create_engine(url).execute(sa.select([Order.__table__.c.user_uid]))]
+        assert all(database.shard_for(uid, 2) == shard for uid in user_uids)
+        archived = [uid for uid, in sa.create_engine(url).execute(sa.select([OrderArchive.c.user_uid]))]
+        assert all(database.shard_for(uid, 2) == shard for uid in archived)
+        indexed = [uid for uid, in sa.create_engine(url).execute(
+            sa.select([database.archive_files.c.value]).where(database.archive_files.c.column_name == "user_uid")
+        )]
+        assert indexed and all(database.shard_for(uid, 2) == shard for uid in indexed)
+
+    with Session() as s:
+        locations = dict(s.query(OrderLocation.order_uid, OrderLocation.shard))
+        assert len(locations) == 20
+        assert locations["order-3"] == database.shard_for("user-3", 2)
+
+
+def test_rebalance_keeps_encoded_shard_out_of_index(fresh_database, tmp_path):
+    urls = [f"sqlite:///{tmp_path / 'shard-0.db'}", f"sqlite:///{tmp_path / 'shard-1.db'}"]
+    engine = sa.create_engine(urls[0])
+    database.Base.metadata.create_all(engine)
+    user_uid = next(f"user-{i}" for i in range(100) if database.shard_for(f"user-{i}", 2) == 0)
+    order_uid = new_order_uid(0)
+    engine.execute(Order.__table__.insert(), [
+        {"item_uid": "item", "order_date": date.today(), "order_uid": order_uid, "status": "PAID",
+         "user_uid": user_uid}
+    ])
+
+    assert rebalance([urls[0]], urls) == 0
+    with Session() as s:
+        assert s.query(OrderLocation).count() == 0
@@ -0,0 +1,110 @@
+import time
+import threading
+
+import pytest
+from flask import Flask
+
+import metrics
+import singleflight
+
+
+WAIT = 5.0
+
+
+def wait_until(condition, timeout=WAIT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.001)
+
+
+def join_all(threads):
+    for thread in threads:
+        thread.join(WAIT)
+        assert not thread.is_alive()
+
+
+def test_concurrent_calls_share_result():
+    group = singleflight.Group("test-group")
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(WAIT)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(group.do("key", work))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: metrics.snapshot().get("test-group.singleflight.coalesced", 0) >= 4)
+    release.set()
+    join_all(threads)
+
+    assert calls == [1]
+    assert results == ["result"] * 5
+    assert group.do("key", lambda: "next") == "next"
+
+
+def test_waiting_is_limited_by_timeout():
+    group = singleflight.Group("test-timeout")
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(WAIT)
+        return "slow"
+
+    leader = threading.Thread(target=lambda: group.do("key", slow))
+    leader.start()
+    assert started.wait(WAIT)
+    with pytest.raises(singleflight.WaitTimeout):
+        group.do("key", lambda: "own", timeout=0.05)
+    release.set()
+    join_all([leader])
+
+
+def test_retry_after_leader_deadline():
+    group = singleflight.Group("test-retry")
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def short_budget():
+        started.set()
+        release.wait(WAIT)
+        raise TimeoutError()
+
+    def leader():
+        try:
+            group.do("key", short_budget)
+        except TimeoutError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    assert started.wait(WAIT)
+    results = []
+    joined = threading.Thread(target=lambda: results.append(
+        group.do("key", lambda: "own", timeout=5, retry_on=(TimeoutError,))
+    ))
+    joined.start()
+    wait_until(lambda: metrics.snapshot().get("test-retry.singleflight.coalesced", 0) >= 1)
+    release.set()
+    join_all([thread, joined])
+    assert len(errors) == 1
+    assert results == ["own"]
+
+
+def test_coalesced_handler_returns_copy():
+    app = Flask(__name__)
+
+    @app.route("/items/<string:item_uid>")
+    @singleflight.coalesce("test-view")
+    def get_item(item_uid):
+        return {"itemUid": item_uid}, 200
+
+    with app.test_client() as test_client:
+        response = test_client.get("/items/1")
+        assert response.status_code == 200
+        assert response.json == {"itemUid": "1"}
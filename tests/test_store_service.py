@@ -2,11 +2,16 @@ from database import Session
 from order_service import Order
 from datetime import date
 import re
+import time
+import threading
 
+import requests
 import requests_mock
 import pytest
 
-from store_service import app, User
+import cache
+import store_service
+from store_service import app, User, warehouse_items, warranty_items
 
 
 @pytest.fixture()
@@ -15,6 +20,48 @@ def add_some_user():
         s.add(User(id=1, name='Alex', user_uid='1'))
 
 
+@pytest.fixture()
+def stale_window(monkeypatch):
+    for items in (warehouse_items, warranty_items):
+        monkeypatch.setattr(items, "stale", 60)
+        monkeypatch.setattr(items, "fresh", 0)
+        items.clear()
+    yield
+    for items in (warehouse_items, warranty_items):
+        items.clear()
+
+
+def mock_services(m, warranty_status="ON_WARRANTY", dependencies_up=True):
+    m.get(re.compile("/manage/health"), text='')
+    order = {
+        'itemUid': 'item-1',
+        'orderDate': '2020-11-22T00:00:00',
+        'orderUid': '1-1-1',
+        'status': 'PAID'
+    }
+    m.get(re.compile("/api/v1/orders/1$"), json=[order])
+    m.get(re.compile("/api/v1/orders/1/1-1-1"), json=order)
+    if dependencies_up:
+        m.get(re.compile("/api/v1/warehouse"), json={'model': 'item one', 'size': 'L'})
+        m.get(re.compile("/api/v1/warranty"), json={
+            "itemUid": "item-1",
+            "warrantyDate": "2020-11-22T00:00:00",
+            "status": warranty_status
+        })
+    else:
+        m.get(f"http://{store_service.WAREHOUSE_SERVICE_URL}/manage/health", exc=requests.ConnectionError)
+        m.get(f"http://{store_service.WARRANTY_SERVICE_URL}/manage/health", status_code=503)
+        m.get(re.compile("/api/v1/warehouse"), status_code=500)
+        m.get(re.compile("/api/v1/warranty"), status_code=500)
+
+
+def wait_refreshed(timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while warehouse_items.refreshing or warranty_items.refreshing:
+        assert time.monotonic() < deadline, "background refresh did not finish in time"
+        time.sleep(0.01)
+
+
 def test_request_all_orders(fresh_database, add_some_user):
     with app.test_client() as test_client:
         with requests_mock.Mocker(real_http=True) as m:
@@ -119,3 +166,133 @@ def test_request_refund(fresh_database, add_some_user):
             m.delete(re.compile("/api/v1/orders/1"))
             response = test_client.delete("/api/v1/store/1/1-1-1/refund")
             assert response.status == "204 NO CONTENT"
+
+
+def test_request_order_fails_without_dependencies(fresh_database, add_some_user):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            mock_services(m, dependencies_up=False)
+            response = test_client.get("/api/v1/store/1/1-1-1")
+            assert response.status_code == 422
+            assert response.json["message"] == "Warehouse sevice unavailable"
+
+
+def test_stale_data_when_dependencies_down(fresh_database, add_some_user, stale_window):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            mock_services(m)
+            response = test_client.get("/api/v1/store/1/1-1-1")
+            assert response.status_code == 200
+            assert "stale" not in response.json
+            assert "Warning" not in response.headers
+            wait_refreshed()
+
+        with requests_mock.Mocker() as m:
+            mock_services(m, dependencies_up=False)
+            response = test_client.get("/api/v1/store/1/1-1-1")
+            assert response.status_code == 200
+            assert response.json["stale"] is True
+            assert response.json["model"] == "item one"
+            assert response.json["warrantyStatus"] == "ON_WARRANTY"
+            assert response.headers["Warning"] == store_service.STALE_WARNING
+
+            response = test_client.get("/api/v1/store/1/orders")
+            assert response.status_code == 200
+            assert response.json[0]["stale"] is True
+            assert response.headers["Warning"] == store_service.STALE_WARNING
+            wait_refreshed()
+
+
+def test_stale_data_is_refreshed_in_background(fresh_database, add_some_user, stale_window):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            mock_services(m)
+            test_client.get("/api/v1/store/1/1-1-1")
+
+            mock_services(m, warranty_status="USE_WARRANTY")
+            response = test_client.get("/api/v1/store/1/1-1-1")
+            assert response.json["warrantyStatus"] == "ON_WARRANTY"
+            wait_refreshed()
+            response = test_client.get("/api/v1/store/1/1-1-1")
+            assert response.json["warrantyStatus"] == "USE_WARRANTY"
+            wait_refreshed()
+
+
+def test_stale_data_when_dependency_is_slow(fresh_database, add_some_user, stale_window):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            mock_services(m)
+            test_client.get("/api/v1/store/1/1-1-1")
+            wait_refreshed()
+
+            m.get(f"http://{store_service.WAREHOUSE_SERVICE_URL}/manage/health", exc=requests.Timeout)
+            m.get(re.compile("/api/v1/warehouse/"), exc=requests.Timeout)
+            response = test_client.get("/api/v1/store/1/1-1-1")
+            assert response.status_code == 200
+            assert response.json["stale"] is True
+            assert response.json["model"] == "item one"
+            wait_refreshed()
+
+
+def test_background_refresh_skips_health_check(fresh_database, add_some_user, stale_window):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            mock_services(m)
+            test_client.get("/api/v1/store/1/1-1-1")
+            wait_refreshed()
+
+            mock_services(m, warranty_status="USE_WARRANTY")
+            m.get(f"http://{store_service.WARRANTY_SERVICE_URL}/manage/health", status_code=503)
+            assert test_client.get("/api/v1/store/1/1-1-1").json["stale"] is True
+            wait_refreshed()
+        assert warranty_items.items["item-1"][1]["status"] == "USE_WARRANTY"
+
+
+def test_stale_window_expires(fresh_database, add_some_user, stale_window):
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            mock_services(m)
+            test_client.get("/api/v1/store/1/1-1-1")
+        for items in (warehouse_items, warranty_items):
+            stored_at, value = items.items["item-1"]
+            items.items["item-1"] = (stored_at - 61, value)
+
+        with requests_mock.Mocker() as m:
+            mock_services(m, dependencies_up=False)
+            response = test_client.get("/api/v1/store/1/1-1-1")
+            assert response.status_code == 422
+
+
+def test_fresh_window_skips_requests(fresh_database, add_some_user, stale_window, monkeypatch):
+    for items in (warehouse_items, warranty_items):
+        monkeypatch.setattr(items, "fresh", 60)
+    with app.test_client() as test_client:
+        with requests_mock.Mocker() as m:
+            mock_services(m)
+            test_client.get("/api/v1/store/1/1-1-1")
+            requests_before = m.call_count
+            response = test_client.get("/api/v1/store/1/1-1-1")
+            assert response.status_code == 200
+            assert "stale" not in response.json
+            # только health-check order_service и заказ
+            assert m.call_count - requests_before == 2
+
+
+def test_background_refreshes_are_bounded():
+    items = cache.StaleWhileRevalidate("test-swr", maxsize=10, fresh=0, stale=60, workers=1, max_pending=1)
+    items.load("a", lambda: 1)
+    items.load("b", lambda: 2)
+    release = threading.Event()
+
+    def slow_fetch():
+        release.wait(5)
+        return 10
+
+    assert items.get("a", slow_fetch) == (1, True)
+    assert items.get("a", slow_fetch) == (1, True)
+    assert items.get("b", slow_fetch) == (2, True)
+    assert items.refreshing == {"a"}
+    release.set()
+    items.executor.shutdown()
+    assert items.items["a"][1] == 10
+    assert items.items["b"][1] == 2
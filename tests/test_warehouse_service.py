@@ -65,3 +65,7 @@ def test_request_remove_item(fresh_database):
         with Session() as s:
             assert s.query(Item).get(1).available_count == 10001
 
+        assert test_client.delete("/api/v1/warehouse/item-1").status_code == 204
+        with Session() as s:
+            assert s.query(Item).get(1).available_count == 10001
+
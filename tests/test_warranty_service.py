@@ -1,8 +1,17 @@
-from datetime import date
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
 import json
+import threading
 
+import pytest
+
+import archive
+import database
+import groupcommit
+import metrics
 from database import Session
-from warranty_service import app, Warranty, Status
+from warranty_service import (app, Warranty, WarrantyArchive, Status, WarrantyExists, expire_warranties,
+                              archive_warranties, insert_warranties)
 
 
 TEST_WARRANTY = {
@@ -58,3 +67,132 @@ def test_request_warranty_result(fresh_database):
                                     json={"reason": "", "availableCount": 0})
         assert response.status_code == 200
         assert json.loads(response.data)["decision"] == "FIXING"
+
+
+def test_expire_warranties(fresh_database):
+    with Session() as s:
+        s.add_all([
+            Warranty(item_uid=f"old-{i}", status=Status.on, warranty_date=date.today() - timedelta(days=400))
+            for i in range(5)
+        ])
+        s.add(Warranty(item_uid="old-removed", status=Status.removed,
+                       warranty_date=date.today() - timedelta(days=400)))
+        s.add(Warranty(**TEST_WARRANTY))
+
+    stats = expire_warranties(period_days=365, batch_size=2, max_chunks=2)
+    assert stats.expired == 4
+    assert stats.chunks == 2
+
+    stats = expire_warranties(period_days=365, batch_size=2, start_id=stats.last_id)
+    assert stats.expired == 1
+
+    with Session() as s:
+        statuses = dict(s.query(Warranty.item_uid, Warranty.status))
+        assert statuses["old-0"] == Status.expired
+        assert statuses["old-4"] == Status.expired
+        assert statuses["old-removed"] == Status.removed
+        assert statuses["1-1-1"] == Status.on
+
+
+def test_request_warranty_status_from_ndjson_archive(fresh_database, tmp_path):
+    with Session() as s:
+        s.add(Warranty(item_uid="old", status=Status.removed, warranty_date=date.today() - timedelta(days=400)))
+        s.add(Warranty(**TEST_WARRANTY))
+
+    with patch("archive.ARCHIVE_DIR", str(tmp_path)):
+        assert archive_warranties(datetime.now() - timedelta(days=365), target="ndjson") == 1
+        with app.test_client() as test_client:
+            response = test_client.get("/api/v1/warranty/old")
+            assert response.status_code == 200
+            assert response.json["status"] == Status.removed
+            assert test_client.get("/api/v1/warranty/1-1-1").status_code == 200
+            assert test_client.get("/api/v1/warranty/unknown").status_code == 404
+
+    with Session() as s:
+        assert [(row.column_name, row.value) for row in s.execute(database.archive_files.select())] == [
+            ("item_uid", "old")
+        ]
+    with pytest.raises(ValueError):
+        archive.find_archived(Warranty.__table__, WarrantyArchive, status=Status.removed.value)
+
+    with Session() as s:
+        s.execute(database.archive_files.delete())
+    with patch("archive.ARCHIVE_DIR", str(tmp_path)):
+        assert archive.reindex_ndjson(Warranty.__table__, WarrantyArchive) == 1
+        with app.test_client() as test_client:
+            assert test_client.get("/api/v1/warranty/old").status_code == 200
+
+
+def test_request_export_warranties(fresh_database):
+    with Session() as s:
+        s.add_all([
+            Warranty(item_uid=f"item-{i}", status=Status.on, warranty_date=date.today() - timedelta(days=i))
+            for i in range(5)
+        ])
+    assert app.view_functions["request_export_warranties"].admission_exempt
+    with app.test_client() as test_client:
+        assert test_client.get("/api/v1/admin/warranty/export").status_code == 403
+
+        with patch("admin.ADMIN_TOKEN", "secret"):
+            response = test_client.get("/api/v1/admin/warranty/export",
+                                       headers={"X-Admin-Token": "secret"},
+                                       query_string={"from": (date.today() - timedelta(days=2)).isoformat()})
+            assert response.status_code == 200
+            assert response.mimetype == "application/x-ndjson"
+            rows = [json.loads(line) for line in response.data.decode().splitlines()]
+            assert [row["item_uid"] for row in rows] == ["item-0", "item-1", "item-2"]
+
+
+def test_request_changes(fresh_database):
+    with app.test_client() as test_client:
+        test_client.post("/api/v1/warranty/1-1-1")
+        test_client.delete("/api/v1/warranty/1-1-1")
+
+        response = test_client.get("/api/v1/warranty/changes?since=0")
+        assert response.status_code == 200
+        changes = response.json["changes"]
+        assert [(c["uid"], c["kind"], c["status"]) for c in changes] == [
+            ("1-1-1", "created", Status.on),
+            ("1-1-1", "status", Status.removed),
+        ]
+        last_seq = response.json["lastSeq"]
+        assert last_seq == changes[-1]["seq"]
+
+        response = test_client.get(f"/api/v1/warranty/changes?since={last_seq}&timeout=0.1")
+        assert response.json == {"changes": [], "lastSeq": last_seq}
+
+        response = test_client.get("/api/v1/warranty/changes?since=0&limit=1")
+        assert len(response.json["changes"]) == 1
+
+
+def test_request_start_warranty_conflict(fresh_database):
+    with app.test_client() as test_client:
+        assert test_client.post("/api/v1/warranty/1-1-1").status_code == 204
+        assert test_client.post("/api/v1/warranty/1-1-1").status_code == 409
+
+
+def test_group_commit_writer(fresh_database):
+    writer = groupcommit.GroupCommitWriter("test-warranty", insert_warranties, window=0.05, max_batch=10)
+    item_uids = ["1", "2", "2", "3", "1"]
+    results = {}
+
+    def submit(i):
+        database.set_client(f"group-commit-{i}")
+        try:
+            writer.submit(item_uids[i])
+            results[i] = "ok"
+        except WarrantyExists:
+            results[i] = "exists"
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(item_uids))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results.values()) == ["exists", "exists", "ok", "ok", "ok"]
+    assert all(database.wrote_recently(f"group-commit-{i}") == (result == "ok") for i, result in results.items())
+    assert metrics.snapshot()["test-warranty.group_commit.rows"] == 5
+    assert metrics.snapshot()["test-warranty.group_commit.batches"] < 5
+    with Session() as s:
+        assert sorted(uid for uid, in s.query(Warranty.item_uid)) == ["1", "2", "3"]
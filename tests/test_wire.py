@@ -0,0 +1,37 @@
+from datetime import date
+
+import pytest
+
+from database import Session
+from order_service import app, Order
+
+msgpack = pytest.importorskip("msgpack")
+
+
+@pytest.fixture()
+def add_some_order():
+    with Session() as s:
+        s.add(Order(item_uid="item-1", order_date=date.today(), order_uid="1-1-1", status="PAID", user_uid="1"))
+
+
+def test_json_is_default(fresh_database, add_some_order):
+    with app.test_client() as test_client:
+        response = test_client.get("/api/v1/orders/1")
+        assert response.mimetype == "application/json"
+        assert response.json[0]["orderUid"] == "1-1-1"
+
+
+def test_msgpack_negotiation(fresh_database, add_some_order):
+    headers = {"Accept": "application/msgpack, application/json;q=0.9"}
+    with app.test_client() as test_client:
+        response = test_client.get("/api/v1/orders/1", headers=headers)
+        assert response.mimetype == "application/msgpack"
+        assert msgpack.unpackb(response.data, raw=False)[0]["orderUid"] == "1-1-1"
+
+        response = test_client.get("/api/v1/orders/1/1-1-1", headers=headers)
+        assert msgpack.unpackb(response.data, raw=False)["itemUid"] == "item-1"
+
+        response = test_client.post("/api/v1/orders/1", data=msgpack.packb({"model": "Lego 8880"}),
+                                    content_type="application/msgpack", headers=headers)
+        assert response.status_code == 400
+        assert response.mimetype == "application/msgpack"
@@ -4,15 +4,25 @@ from datetime import date
 from enum import Enum
 from uuid import uuid4
 
-import requests
 from pydantic import BaseModel, ValidationError
-from flask import Flask, request
+from flask import Flask
 import sqlalchemy as sa
 
 import database
+import metrics
+import admission
+import service_client
+import wire
+import profiling
+import archive
 
 
 app = Flask(__name__)
+metrics.init_app(app)
+admission.init_app(app, "warehouse")
+wire.init_app(app)
+profiling.init_app(app, "warehouse")
+service_client.init_app(app)
 ROOT_PATH = "/api/v1"
 WARRANTY_SERVICE_URL = os.environ.get("WARRANTY_SERVICE_URL", "localhost:8180")
 print(f"Warranty service url: {WARRANTY_SERVICE_URL} ($WARRANTY_SERVICE_URL)")
@@ -35,6 +45,11 @@ class OrderItem(database.Base):
     item_id = sa.Column(sa.Integer, sa.ForeignKey(Item.id, ondelete="CASCADE"))
 
 
+OrderItemArchive = database.archive_table(OrderItem.__table__, "order_item_uid")
+item_info_query = database.bakery(lambda s: s.query(Item.model, Item.size).join(OrderItem))
+item_info_query += lambda q: q.filter(OrderItem.order_item_uid == sa.bindparam("order_item_uid"))
+
+
 class NewItemRequest(BaseModel):
     orderUid: str
     model: str
@@ -45,17 +60,30 @@ class WarrantyRequest(BaseModel):
     reason: str
 
 
+DEFAULT_ITEMS = [("Lego 8070", "M"), ("Lego 42070", "L"), ("Lego 8880", "L")]
+
+
 def refresh_items_in_db():
+    """
+    Добавить стандартные модели, которых еще нет. Остальные строки не трогаются:
+    удаление item каскадом удалило бы order_item, в том числе сгенерированные datagen
+    """
     with database.Session() as s:
-        s.execute(Item.__table__.delete())
+        existing = set(s.query(Item.model, Item.size))
         s.add_all([
-            Item(id=1, available_count=10000, model="Lego 8070", size="M"),
-            Item(id=2, available_count=10000, model="Lego 42070", size="L"),
-            Item(id=3, available_count=10000, model="Lego 8880", size="L"),
+            Item(available_count=10000, model=model, size=size)
+            for model, size in DEFAULT_ITEMS if (model, size) not in existing
         ])
         print("Initialized default values in Item table")
 
 
+def archive_order_items(**kwargs):
+    """
+    В order_item нет даты, поэтому в архив уходят только отмененные (возвращенные) позиции
+    """
+    return archive.archive_rows(OrderItem.__table__, OrderItemArchive, OrderItem.canceled.is_(True), **kwargs)
+
+
 @app.route("/manage/health", methods=["GET"])
 def health_check():
     return "UP", 200
@@ -66,19 +94,24 @@ def request_get_info(order_item_id):
     """
     Информация о вещах на складе
     """
-    with database.Session() as s:
-        order_and_item = (
-            s.query(OrderItem, Item)
-            .join(Item)
-            .filter(OrderItem.order_item_uid == order_item_id)
-            .one_or_none()
-        )
-        print("test item getting:", order_and_item)
-        if not order_and_item:
+    with database.Session(readonly=True) as s:
+        item = item_info_query(s).params(order_item_uid=order_item_id).one_or_none()
+        if item:
+            return {
+                "model": item.model,
+                "size": item.size,
+            }, 200
+
+    archived = archive.find_archived(OrderItem.__table__, OrderItemArchive, order_item_uid=order_item_id)
+    if not archived:
+        return {"message": "Not found"}, 404
+    with database.Session(readonly=True) as s:
+        item = s.query(Item).get(archived[0].item_id)
+        if not item:
             return {"message": "Not found"}, 404
         return {
-            "model": order_and_item.Item.model,
-            "size": order_and_item.Item.size,
+            "model": item.model,
+            "size": item.size,
         }, 200
 
 
@@ -88,7 +121,7 @@ def request_new_item():
     Запрос на получение вещи со склада по новому заказу
     """
     try:
-        new_item_request = NewItemRequest.parse_obj(request.get_json(force=True))
+        new_item_request = NewItemRequest.parse_obj(wire.get_payload())
     except ValidationError as e:
         return {"message": e.errors()}, 400
 
@@ -128,12 +161,13 @@ def request_warranty(order_item_id):
     Запрос решения по гарантии
     """
     try:
-        warranty_request = WarrantyRequest.parse_obj(request.get_json(force=True))
+        warranty_request = WarrantyRequest.parse_obj(wire.get_payload())
     except ValidationError as e:
         return {"message": e.errors()}, 400
 
-    if not requests.get(f"http://{WARRANTY_SERVICE_URL}/manage/health").ok:
+    if not service_client.get(f"http://{WARRANTY_SERVICE_URL}/manage/health").ok:
         return {"message": "Warranty sevice unavailable"}, 422
+    service_client.check_deadline()
 
     with database.Session() as s:
         order_and_item = (
@@ -146,20 +180,20 @@ def request_warranty(order_item_id):
             return {"message": "Order not found"}, 404
         available_count = order_and_item.Item.available_count
 
-    warranty_service_response = requests.post(
+    warranty_service_response = service_client.post(
         f"http://{WARRANTY_SERVICE_URL}{ROOT_PATH}/warranty/{order_item_id}/warranty",
         json={"reason": warranty_request.reason, "availableCount": available_count}
     )
     if not warranty_service_response.ok:
         return {"message": f"Warranty not found for itemUid '{order_item_id}'"}, 404
 
-    return warranty_service_response.json(), 200
+    return service_client.payload(warranty_service_response), 200
 
 
 @app.route(f"{ROOT_PATH}/warehouse/<string:order_item_id>", methods=["DELETE"])
 def request_remove_item(order_item_id):
     """
-    Вернуть заказ на склад
+    Вернуть заказ на склад. Повторный возврат (после таймаута у order_service) ничего не меняет
     """
     with database.Session() as s:
         order_and_item = (
@@ -170,6 +204,9 @@ def request_remove_item(order_item_id):
         )
         if not order_and_item:
             return {"message": "Not found"}, 404
+        if order_and_item.OrderItem.canceled:
+            # повтор после таймаута: товар уже вернули
+            return '', 204
         order_and_item.Item.available_count += 1
         order_and_item.OrderItem.canceled = True
         s.commit()
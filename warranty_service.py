@@ -1,16 +1,42 @@
 import os
-from datetime import date
+import time
+import threading
+from datetime import date, datetime, timedelta
 from enum import Enum
 
 from pydantic import BaseModel, ValidationError
-from flask import Flask, request
+from flask import Flask
 import sqlalchemy as sa
 
 import database
+import metrics
+import admission
+import service_client
+import wire
+import profiling
+import singleflight
+import archive
+import admin
+import export
+import changefeed
+import groupcommit
 
 
 app = Flask(__name__)
+metrics.init_app(app)
+admission.init_app(app, "warranty")
+wire.init_app(app)
+profiling.init_app(app, "warranty")
+service_client.init_app(app)
 ROOT_PATH = "/api/v1"
+WARRANTY_PERIOD_DAYS = int(os.environ.get("WARRANTY_PERIOD_DAYS", 365))
+print(f"Warranty period: {WARRANTY_PERIOD_DAYS} days ($WARRANTY_PERIOD_DAYS)")
+WARRANTY_SWEEP_INTERVAL = int(os.environ.get("WARRANTY_SWEEP_INTERVAL", 0))
+print(f"Warranty sweep interval: {WARRANTY_SWEEP_INTERVAL} s ($WARRANTY_SWEEP_INTERVAL)")
+WARRANTY_GROUP_COMMIT_WINDOW_MS = float(os.environ.get("WARRANTY_GROUP_COMMIT_WINDOW_MS", 0))
+print(f"Warranty group commit window: {WARRANTY_GROUP_COMMIT_WINDOW_MS} ms "
+      f"($WARRANTY_GROUP_COMMIT_WINDOW_MS, 0 - disabled)")
+WARRANTY_GROUP_COMMIT_MAX_ROWS = int(os.environ.get("WARRANTY_GROUP_COMMIT_MAX_ROWS", 100))
 
 
 class Warranty(database.Base):
@@ -22,10 +48,20 @@ class Warranty(database.Base):
     warranty_date = sa.Column(sa.TIMESTAMP)
 
 
+WarrantyArchive = database.archive_table(Warranty.__table__, "item_uid")
+warranty_status_query = database.bakery(
+    lambda s: s.query(Warranty.item_uid, Warranty.warranty_date, Warranty.status)
+)
+warranty_status_query += lambda q: q.filter(Warranty.item_uid == sa.bindparam("item_uid"))
+warranty_changes = changefeed.ChangeFeed("warranty_changes")
+warranty_changes.init_app(app, f"{ROOT_PATH}/warranty/changes")
+
+
 class Status(str, Enum):
     on = "ON_WARRANTY"
     use = "USE_WARRANTY"
     removed = "REMOVED_FROM_WARRANTY"
+    expired = "EXPIRED_WARRANTY"
 
 
 class WarrantyRequest(BaseModel):
@@ -33,25 +69,179 @@ class WarrantyRequest(BaseModel):
     availableCount: int
 
 
+class WarrantyExists(Exception):
+    pass
+
+
+class SweepStats(BaseModel):
+    expired: int = 0
+    chunks: int = 0
+    last_id: int = 0
+    elapsed: float = 0.0
+    max_lock_time: float = 0.0
+    total_lock_time: float = 0.0
+
+    @property
+    def throughput(self):
+        return self.expired / self.elapsed if self.elapsed else 0.0
+
+    def report(self):
+        return (f"expired {self.expired} warranties in {self.chunks} chunks "
+                f"({self.elapsed:.2f} s, {self.throughput:.0f} rows/s), "
+                f"lock time max {self.max_lock_time * 1000:.1f} ms, "
+                f"avg {self.total_lock_time / max(self.chunks, 1) * 1000:.1f} ms, "
+                f"last id {self.last_id}")
+
+
+def expire_warranties(period_days=WARRANTY_PERIOD_DAYS, batch_size=1000, start_id=0, max_chunks=None):
+    """
+    Перевести просроченные гарантии из ON_WARRANTY в EXPIRED_WARRANTY.
+
+    Таблица обходится диапазонами id по batch_size строк, каждый диапазон
+    обновляется одним UPDATE в отдельной транзакции, поэтому блокировки
+    держатся недолго, а прерванный проход можно продолжить с last_id.
+    """
+    table = Warranty.__table__
+    cutoff = datetime.combine(date.today() - timedelta(days=period_days), datetime.min.time())
+    stats = SweepStats(last_id=start_id)
+    started = time.monotonic()
+
+    while max_chunks is None or stats.chunks < max_chunks:
+        chunk_started = time.monotonic()
+        with database.Session() as s:
+            upper_id = s.execute(
+                sa.select([table.c.id])
+                .where(table.c.id > stats.last_id)
+                .order_by(table.c.id)
+                .offset(batch_size - 1)
+                .limit(1)
+            ).scalar()
+            if upper_id is None:
+                upper_id = s.execute(
+                    sa.select([sa.func.max(table.c.id)]).where(table.c.id > stats.last_id)
+                ).scalar()
+            if upper_id is None:
+                break
+            condition = sa.and_(
+                table.c.id > stats.last_id,
+                table.c.id <= upper_id,
+                table.c.status == Status.on.value,
+                table.c.warranty_date < cutoff,
+            )
+            warranty_changes.record_from_select(
+                s, "status", sa.select([table.c.item_uid, sa.literal(Status.expired.value)]).where(condition)
+            )
+            result = s.execute(table.update().where(condition).values(status=Status.expired.value))
+        lock_time = time.monotonic() - chunk_started
+        stats.expired += result.rowcount
+        stats.chunks += 1
+        stats.last_id = upper_id
+        stats.total_lock_time += lock_time
+        stats.max_lock_time = max(stats.max_lock_time, lock_time)
+
+    stats.elapsed = time.monotonic() - started
+    return stats
+
+
+def insert_warranties(item_uids):
+    """
+    Начать гарантии для item_uids одной транзакцией (одним INSERT).
+    Результат для каждого item_uid: None или WarrantyExists, если гарантия на него
+    уже есть в базе или встретилась раньше в этой же пачке
+    """
+    table = Warranty.__table__
+    results = [None] * len(item_uids)
+    try:
+        with database.Session() as s:
+            existing = {uid for uid, in s.execute(
+                sa.select([table.c.item_uid]).where(table.c.item_uid.in_(set(item_uids)))
+            )}
+            new_uids = []
+            for i, item_uid in enumerate(item_uids):
+                if item_uid in existing:
+                    results[i] = WarrantyExists(item_uid)
+                else:
+                    existing.add(item_uid)
+                    new_uids.append(item_uid)
+            if new_uids:
+                s.execute(table.insert().values([
+                    {"item_uid": item_uid, "status": Status.on.value, "warranty_date": date.today()}
+                    for item_uid in new_uids
+                ]))
+                warranty_changes.record_many(s, [(item_uid, "created", Status.on.value) for item_uid in new_uids])
+    except sa.exc.IntegrityError:
+        # кто-то успел вставить ту же гарантию параллельно - разбираем пачку по одной строке
+        if len(item_uids) == 1:
+            return [WarrantyExists(item_uids[0])]
+        return [insert_warranties([item_uid])[0] for item_uid in item_uids]
+    return results
+
+
+warranty_writer = None
+if WARRANTY_GROUP_COMMIT_WINDOW_MS > 0:
+    warranty_writer = groupcommit.GroupCommitWriter(
+        "warranty", insert_warranties,
+        window=WARRANTY_GROUP_COMMIT_WINDOW_MS / 1000,
+        max_batch=WARRANTY_GROUP_COMMIT_MAX_ROWS,
+    )
+
+
+def start_expiry_sweeper(interval=WARRANTY_SWEEP_INTERVAL, **sweep_kwargs):
+    """
+    Запустить фоновый поток, который раз в interval секунд вызывает expire_warranties
+    """
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                print("Warranty sweeper:", expire_warranties(**sweep_kwargs).report())
+            except Exception as e:
+                print("Warranty sweeper failed:", repr(e))
+
+    thread = threading.Thread(target=loop, name="warranty-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def warranty_to_json(warranty):
+    return {
+        "itemUid": warranty.item_uid,
+        "warrantyDate": warranty.warranty_date.isoformat(),
+        "status": warranty.status
+    }
+
+
+def archive_warranties(cutoff, **kwargs):
+    """
+    Активные гарантии не архивируются, иначе по ним нельзя будет принять решение
+    """
+    return archive.archive_rows(
+        Warranty.__table__, WarrantyArchive,
+        sa.and_(Warranty.warranty_date < cutoff, Warranty.status != Status.on.value),
+        **kwargs
+    )
+
+
 @app.route("/manage/health", methods=["GET"])
 def health_check():
     return "UP", 200
 
 
 @app.route(f"{ROOT_PATH}/warranty/<string:item_uid>", methods=["GET"])
+@singleflight.coalesce("warranty", timeout=service_client.remaining, retry_on=service_client.DEADLINE_ERRORS)
 def request_warranty_status(item_uid):
     """
     Информация о статусе гарантии
     """
-    with database.Session() as s:
-        warranty = s.query(Warranty).filter(Warranty.item_uid == item_uid).one_or_none()
-        if not warranty:
-            return {"message": "Not found"}, 404
-        return {
-                   "itemUid": warranty.item_uid,
-                   "warrantyDate": warranty.warranty_date.isoformat(),
-                   "status": warranty.status
-               }, 200
+    with database.Session(readonly=True) as s:
+        warranty = warranty_status_query(s).params(item_uid=item_uid).one_or_none()
+        if warranty:
+            return warranty_to_json(warranty), 200
+
+    archived = archive.find_archived(Warranty.__table__, WarrantyArchive, item_uid=item_uid)
+    if not archived:
+        return {"message": "Not found"}, 404
+    return warranty_to_json(archived[0]), 200
 
 
 @app.route(f"{ROOT_PATH}/warranty/<string:item_uid>/warranty", methods=["POST"])
@@ -60,7 +250,7 @@ def request_warranty_result(item_uid):
     Запрос решения по гарантии
     """
     try:
-        warranty_request = WarrantyRequest.parse_obj(request.get_json(force=True))
+        warranty_request = WarrantyRequest.parse_obj(wire.get_payload())
     except ValidationError as e:
         return {"message": e.errors()}, 400
 
@@ -74,6 +264,7 @@ def request_warranty_result(item_uid):
             decision = "RETURN"
         else:
             decision = "FIXING"
+        warranty_changes.record(s, item_uid, "decision", decision)
 
         return {
                    "warrantyDate": warranty.warranty_date.isoformat(),
@@ -86,12 +277,15 @@ def request_start_warranty(item_uid):
     """
     Запрос на начало гарантийного периода
     """
-    with database.Session() as s:
-        s.add(Warranty(
-            item_uid=item_uid,
-            status=Status.on,
-            warranty_date=date.today(),
-        ))
+    try:
+        if warranty_writer:
+            warranty_writer.submit(item_uid)
+        else:
+            error = insert_warranties([item_uid])[0]
+            if error:
+                raise error
+    except WarrantyExists:
+        return {"message": "Warranty already exists"}, 409
     return '', 204
 
 
@@ -104,14 +298,27 @@ def request_stop_warranty(item_uid):
         warranty = s.query(Warranty).filter(Warranty.item_uid == item_uid).one_or_none()
         if warranty:
             warranty.status = Status.removed
+            warranty_changes.record(s, item_uid, "status", Status.removed.value)
         else:
             return {"message": "Not found"}, 404
     return '', 204
 
 
+@app.route(f"{ROOT_PATH}/admin/warranty/export", methods=["GET"])
+@admission.exempt
+@admin.admin_required
+def request_export_warranties():
+    """
+    Выгрузка всех гарантий в NDJSON (для аналитики)
+    """
+    return export.export_ndjson(Warranty.__table__, "warranty_date", archive=WarrantyArchive)
+
+
 if __name__ == '__main__':
     PORT = os.environ.get("PORT", 7777)
     print("LISTENING ON PORT:", PORT, "($PORT)")
     database.create_schema()
+    if WARRANTY_SWEEP_INTERVAL > 0:
+        start_expiry_sweeper()
     app.url_map.strict_slashes = False
     app.run("0.0.0.0", PORT)
@@ -0,0 +1,28 @@
+import argparse
+
+import warranty_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перевод просроченных гарантий в EXPIRED_WARRANTY")
+    parser.add_argument("--period-days", type=int, default=warranty_service.WARRANTY_PERIOD_DAYS,
+                        help="гарантийный срок в днях ($WARRANTY_PERIOD_DAYS)")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="сколько строк (по id) обновлять в одной транзакции")
+    parser.add_argument("--start-id", type=int, default=0,
+                        help="продолжить с id, напечатанного прошлым запуском")
+    parser.add_argument("--max-chunks", type=int, default=None,
+                        help="остановиться после N транзакций")
+    args = parser.parse_args()
+
+    stats = warranty_service.expire_warranties(
+        period_days=args.period_days,
+        batch_size=args.batch_size,
+        start_id=args.start_id,
+        max_chunks=args.max_chunks,
+    )
+    print(stats.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Формат тел запросов и ответов между сервисами.
+
+Если установлен msgpack, клиент с Accept: application/msgpack получает ответ
+в MessagePack, а тело запроса с Content-Type: application/msgpack разбирается
+как MessagePack. Все остальные клиенты по-прежнему работают с JSON
+"""
+import flask
+from flask import request, Response
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MIMETYPE = "application/msgpack"
+ACCEPT = f"{MSGPACK_MIMETYPE}, application/json;q=0.9" if msgpack else "application/json"
+
+
+def dumps(payload):
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def wants_msgpack():
+    if msgpack is None:
+        return False
+    accept = request.accept_mimetypes
+    return accept.quality(MSGPACK_MIMETYPE) > accept.quality("application/json")
+
+
+def get_payload():
+    """
+    Тело запроса: MessagePack или JSON (как request.get_json(force=True))
+    """
+    if msgpack is not None and request.mimetype == MSGPACK_MIMETYPE:
+        return loads(request.get_data())
+    return request.get_json(force=True)
+
+
+def jsonify(payload):
+    """
+    Как flask.jsonify, но в MessagePack, если клиент его запросил
+    """
+    if wants_msgpack():
+        return Response(dumps(payload), mimetype=MSGPACK_MIMETYPE)
+    return flask.jsonify(payload)
+
+
+def init_app(app):
+    """
+    Ответы-словари обработчиков отдаются в MessagePack, если клиент его запросил
+    """
+    make_response = app.make_response
+
+    def negotiated_make_response(rv):
+        body, rest = (rv[0], rv[1:]) if isinstance(rv, tuple) else (rv, ())
+        if isinstance(body, dict) and wants_msgpack():
+            return make_response((Response(dumps(body), mimetype=MSGPACK_MIMETYPE), *rest))
+        return make_response(rv)
+
+    app.make_response = negotiated_make_response